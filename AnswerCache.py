@@ -0,0 +1,115 @@
+import re
+import time
+
+import numpy as np
+
+from CacheUtils import open_sqlite
+
+# Words that point back to earlier turns ("what about it?", "explain that again")
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|that|this|these|those|they|them|their|he|she|him|her|his|above|previous|earlier|"
+    r"again|more|also|same|else|further|elaborate|continue)\b",
+    re.IGNORECASE,
+)
+
+
+def is_standalone_question(question, chat_history):
+    """
+    Check if a question can be answered without the chat history.
+    Args:
+        question (str): The user question.
+        chat_history (list): Messages shown so far in the session.
+    Returns:
+        bool: True for the first question, or a question with no reference to earlier turns.
+    """
+    if not chat_history:
+        return True
+    return FOLLOW_UP_PATTERN.search(question) is None
+
+
+class AnswerCache:
+    """
+    Answers shared across sessions, keyed by document set and question embedding.
+    A stored answer is served when a new question on the same documents is close
+    enough (cosine similarity) to a question already answered.
+    """
+
+    def __init__(self, threshold=0.95, ttl_seconds=7 * 24 * 3600, max_entries=10000, db_path=None):
+        """
+        Args:
+            threshold (float): Minimum cosine similarity to serve a stored answer.
+            ttl_seconds (int): Age after which an answer is not served anymore.
+            max_entries (int): Number of answers kept, the least recently used are evicted.
+            db_path (str): SQLite file, defaults to the "answers" cache.
+        """
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._conn, self._lock = open_sqlite(
+            "answers",
+            "CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY, doc_set_key TEXT, question TEXT, "
+            "vector BLOB, answer TEXT, created_at REAL, last_used REAL)",
+            "CREATE INDEX IF NOT EXISTS answers_doc_set ON answers (doc_set_key)",
+            "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)",
+            db_path=db_path,
+        )
+
+    def _count(self, name):
+        self._conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,)
+        )
+
+    def lookup(self, doc_set_key, question_vector):
+        """
+        Find a stored answer for a question on a document set.
+        Args:
+            doc_set_key (str): Hash of the indexed documents.
+            question_vector (List[float]): Embedding of the question.
+        Returns:
+            str or None: The stored answer, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, vector, answer FROM answers WHERE doc_set_key = ? AND created_at >= ?",
+                (doc_set_key, now - self.ttl_seconds),
+            ).fetchall()
+            answer = None
+            if rows:
+                matrix = np.stack([np.frombuffer(vector, dtype=np.float32) for _, vector, _ in rows])
+                query = np.asarray(question_vector, dtype=np.float32)
+                similarities = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    answer = rows[best][2]
+                    self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, rows[best][0]))
+            self._count("hits" if answer is not None else "misses")
+            self._conn.commit()
+        return answer
+
+    def store(self, doc_set_key, question, question_vector, answer):
+        """
+        Save an answer, then drop expired answers and evict the least recently used ones.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (doc_set_key, question, vector, answer, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_set_key, question, np.asarray(question_vector, dtype=np.float32).tobytes(), answer, now, now),
+            )
+            self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        """
+        Hit and miss counters shared by every session.
+        Returns:
+            dict: {"hits": int, "misses": int}
+        """
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+        return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0)}
@@ -0,0 +1,261 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+import requests
+from gtts import gTTS, gTTSError
+
+from CacheUtils import atomic_write, cache_dir, evict_lru, hash_parts, touch
+from RateLimiter import backoff_delay
+from TextSplitter import SENTENCE_BOUNDARY, SentenceTokenSplitter
+
+# Size of one synthesized segment in tokens (about 4 characters each), cut at sentence / paragraph ends
+TTS_SEGMENT_TOKENS = int(os.getenv("TTS_SEGMENT_TOKENS", "600"))
+# Segments synthesized at once, gTTS sends one request per ~100 characters so keep this modest
+TTS_MAX_WORKERS = int(os.getenv("TTS_MAX_WORKERS", "4"))
+TTS_MAX_RETRIES = 5
+TTS_TIMEOUT = 30
+# gTTS voice (the Google domain picks the accent, e.g. "co.uk")
+TTS_VOICE = os.getenv("TTS_VOICE", "com")
+TTS_ENGINE = "gtts"
+# Size budget of the cached sentence audio shared by every session
+TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", "1024"))
+# gTTS refuses text with nothing to speak (e.g. dot leaders of a table of contents)
+SPEAKABLE = re.compile(r"\w")
+# Playable parts published while synthesizing: the first is one segment (fast start),
+# then each part doubles up to this many segments
+PART_MAX_SEGMENTS = int(os.getenv("TTS_PART_MAX_SEGMENTS", "16"))
+
+# MPEG audio Layer III bitrates (kbps) by header index, for MPEG-1 and MPEG-2 / 2.5
+_BITRATES = {
+    "1": [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0],
+    "2": [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0],
+}
+# Sample rates (Hz) by MPEG version bits and header index
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def split_for_speech(text, segment_tokens=TTS_SEGMENT_TOKENS):
+    """
+    Cut a text into segments for synthesis, at sentence and paragraph boundaries.
+    Returns:
+        List[str]: The segments, in order.
+    """
+    splitter = SentenceTokenSplitter(chunk_size=segment_tokens, chunk_overlap=0)
+    return [segment for segment in splitter.split_text(text) if segment.strip()]
+
+
+def normalize_speech_text(text):
+    """
+    Text as it is spoken: whitespace differences (e.g. PDF line breaks) do not change the audio.
+    """
+    return " ".join(text.split())
+
+
+class SpeechCache:
+    """
+    MP3 audio of single sentences on disk, keyed by normalized text, language, voice and engine.
+    An edited text or a PDF already converted by someone else only synthesizes the new sentences.
+    """
+
+    def __init__(self, max_bytes=TTS_CACHE_MAX_MB * 1024 * 1024, directory=None):
+        """
+        Args:
+            max_bytes (int): Size budget, the least recently used sentences are evicted past it.
+            directory (str): Cache folder, defaults to the shared cache folder.
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory or cache_dir("tts_segments")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text, lang, voice=TTS_VOICE, engine=TTS_ENGINE):
+        return hash_parts(normalize_speech_text(text), lang, voice, engine)
+
+    def get(self, key):
+        """
+        Cached audio of a key, or None on a miss.
+        """
+        path = os.path.join(self.directory, f"{key}.mp3")
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+        except OSError:
+            audio = None
+        with self._lock:
+            if audio is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if audio is not None:
+            touch(path)  # mark the entry as recently used
+        return audio
+
+    def put(self, key, audio):
+        with atomic_write(os.path.join(self.directory, f"{key}.mp3")) as tmp_path, open(tmp_path, "wb") as f:
+            f.write(audio)
+
+    def evict(self):
+        """
+        Delete the least recently used sentences past the size budget (run once per audiobook).
+        """
+        return evict_lru(self.directory, self.max_bytes)
+
+    def stats(self):
+        """
+        Hit and miss counters of this process.
+        Returns:
+            dict: {"hits": int, "misses": int, "hit_rate": float}
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+def synthesize_speech(text, lang="en", voice=TTS_VOICE, max_retries=TTS_MAX_RETRIES):
+    """
+    Synthesize a text to MP3 bytes with gTTS, retrying with backoff on network errors and throttling.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            buffer = BytesIO()
+            gTTS(text=text, lang=lang, tld=voice, timeout=TTS_TIMEOUT).write_to_fp(buffer)
+            return buffer.getvalue()
+        except (gTTSError, requests.RequestException):
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff_delay(attempt))
+
+
+def synthesize_segment(text, lang="en", voice=TTS_VOICE, cache=None):
+    """
+    Synthesize one segment to MP3 bytes.
+    With a cache the segment is synthesized sentence by sentence and only the sentences
+    missing from the cache are sent to gTTS.
+    """
+    if not SPEAKABLE.search(text):
+        return b""
+    if cache is None:
+        return synthesize_speech(normalize_speech_text(text), lang, voice)
+    audio_parts = []
+    for sentence in SENTENCE_BOUNDARY.split(text):
+        sentence = normalize_speech_text(sentence)
+        if not SPEAKABLE.search(sentence):
+            continue  # punctuation only, nothing to say
+        key = cache.key(sentence, lang, voice)
+        audio = cache.get(key)
+        if audio is None:
+            audio = synthesize_speech(sentence, lang, voice)
+            cache.put(key, audio)
+        audio_parts.append(audio)
+    return concat_mp3(audio_parts)
+
+
+def _frame_length(header):
+    """
+    Length in bytes of the MPEG Layer III frame starting with a 4 byte header, or 0 if it is not one.
+    """
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return 0
+    version = (header[1] >> 3) & 0x03  # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    layer = (header[1] >> 1) & 0x03  # 1 = Layer III
+    bitrate_index, rate_index, padding = header[2] >> 4, (header[2] >> 2) & 0x03, (header[2] >> 1) & 0x01
+    if version == 1 or layer != 1 or rate_index == 3:
+        return 0
+    bitrate = _BITRATES["1" if version == 3 else "2"][bitrate_index] * 1000
+    if not bitrate:
+        return 0
+    samples_factor = 144 if version == 3 else 72
+    return samples_factor * bitrate // _SAMPLE_RATES[version][rate_index] + padding
+
+
+def mp3_frames_only(data):
+    """
+    Strip what is not audio from an MP3 file: ID3v2 / ID3v1 tags and the Xing / Info header frame.
+    Those describe one file, so they must not end up in the middle (or at the start) of a joined file.
+    """
+    start, end = 0, len(data)
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]  # syncsafe integer
+        start = 10 + size + (10 if data[5] & 0x10 else 0)  # footer flag
+    if end - start >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    frame_length = _frame_length(data[start:start + 4])
+    if frame_length and (b"Xing" in data[start:start + frame_length] or b"Info" in data[start:start + frame_length]):
+        start += frame_length
+    return data[start:end]
+
+
+def concat_mp3(parts):
+    """
+    Join MP3 files frame by frame, without decoding or re-encoding.
+    The parts must share the same sample rate and channel layout (true for gTTS output).
+    """
+    return b"".join(mp3_frames_only(part) for part in parts)
+
+
+def part_bounds(segment_count, max_segments=PART_MAX_SEGMENTS):
+    """
+    Group segments into playable parts of 1, 2, 4, ... segments (capped at max_segments).
+    Returns:
+        List[Tuple[int, int]]: (first segment, last segment + 1) of each part.
+    """
+    bounds, start, size = [], 0, 1
+    while start < segment_count:
+        bounds.append((start, min(segment_count, start + size)))
+        start += size
+        size = min(size * 2, max_segments)
+    return bounds
+
+
+def synthesize_segments(segments, lang="en", max_workers=TTS_MAX_WORKERS, on_progress=None, on_part=None, cache=None):
+    """
+    Synthesize segments concurrently.
+    Args:
+        segments (List[str]): Texts to speak, in order.
+        lang (str): gTTS language.
+        max_workers (int): Segments synthesized at once.
+        on_progress (callable): Called with (done, total) as the segments finish.
+        on_part (callable): Called with (part number, mp3 bytes) as soon as every segment of the
+            next part is ready, so playback can start before the whole text is synthesized.
+        cache (SpeechCache): Sentence audio cache, or None.
+    Returns:
+        List[bytes]: MP3 bytes of each segment, in order.
+    """
+    audio_parts = [None] * len(segments)
+    parts = part_bounds(len(segments))
+    next_part = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        # submitted in order, so the first segments are also the first to finish
+        futures = {executor.submit(synthesize_segment, segment, lang, TTS_VOICE, cache): index for index, segment in enumerate(segments)}
+        for done, future in enumerate(as_completed(futures), 1):
+            audio_parts[futures[future]] = future.result()
+            # callbacks run in this thread, so Streamlit calls work in them
+            if on_progress:
+                on_progress(done, len(segments))
+            while on_part and next_part < len(parts) and all(audio_parts[i] is not None for i in range(*parts[next_part])):
+                start, end = parts[next_part]
+                on_part(next_part + 1, concat_mp3(audio_parts[start:end]))
+                next_part += 1
+    return audio_parts
+
+
+def text_to_speech_file(text, output_path, lang="en", max_workers=TTS_MAX_WORKERS, on_progress=None, on_part=None,
+                        cache=None):
+    """
+    Synthesize a long text in parallel segments and write them as one MP3 file.
+    Returns:
+        int: Number of segments.
+    """
+    segments = split_for_speech(text)
+    audio_parts = synthesize_segments(segments, lang, max_workers, on_progress, on_part, cache)
+    with open(output_path, "wb") as f:
+        f.write(concat_mp3(audio_parts))
+    if cache is not None:
+        cache.evict()
+    return len(segments)
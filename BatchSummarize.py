@@ -0,0 +1,181 @@
+"""
+Headless batch summarization of PDF folders and URL lists, for overnight runs.
+
+Usage:
+    python BatchSummarize.py course_folder/ --prompt "Summarize for a student" --output summaries.jsonl
+    python BatchSummarize.py manifest.jsonl --workers 8 --chain-type map_reduce
+
+The input is a folder (every PDF under it) or a manifest: a .txt file with one PDF path
+or URL per line, or a .jsonl file with {"source": ..., "prompt": ...} objects.
+Results are appended to the output JSONL as items finish; running the same command again
+skips the items already done with the same settings.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+from langchain.chat_models import ChatOpenAI
+
+from CacheUtils import hash_parts
+from ExtractiveCompressor import ExtractiveCompressor
+from SummaryPipeline import (YOUTUBE_URL_PATTERN, custom_summary, fetch_blog_content, fetch_youtube_transcript,
+                             setup_documents, split_text_documents)
+
+FILE_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """
+    sha256 of a file, read block by block.
+    """
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(FILE_BLOCK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def is_url(source):
+    """
+    Check if an item source is a URL rather than a file path.
+    """
+    return source.startswith(("http://", "https://"))
+
+
+def read_items(input_path, default_prompt):
+    """
+    List the items of a folder or a manifest.
+    Returns:
+        List[dict]: {"source": path or URL, "prompt": custom prompt} for each item.
+    """
+    if os.path.isdir(input_path):
+        paths = []
+        for root, _, files in os.walk(input_path):
+            paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(".pdf"))
+        return [{"source": path, "prompt": default_prompt} for path in sorted(paths)]
+
+    items = []
+    base_dir = os.path.dirname(os.path.abspath(input_path))
+    with open(input_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line) if input_path.endswith(".jsonl") else {"source": line}
+            item.setdefault("prompt", default_prompt)
+            if not is_url(item["source"]) and not os.path.isabs(item["source"]):
+                item["source"] = os.path.join(base_dir, item["source"])  # paths are relative to the manifest
+            items.append(item)
+    return items
+
+
+def item_key(item, args):
+    """
+    Key of one result: same source (and file content), prompt and settings give the same key.
+    """
+    return hash_parts(item["source"], item.get("file_hash"), item["prompt"], args.chain_type, args.chunk_size, args.chunk_overlap,
+                      args.model, args.temperature, args.num_summaries, args.compress)
+
+
+def completed_keys(output_path):
+    """
+    Keys of the items already summarized in an output file (failed items are retried).
+    """
+    keys = set()
+    if not os.path.exists(output_path):
+        return keys
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # line cut by an interrupted run
+            if record.get("status") == "ok":
+                keys.add(record["key"])
+    return keys
+
+
+def load_item_documents(source, chunk_size, chunk_overlap, file_hash=None):
+    """
+    Load and split one item, returns (docs, error messages).
+    """
+    errors = []
+    if is_url(source):
+        if YOUTUBE_URL_PATTERN.search(source):
+            text, _ = fetch_youtube_transcript(source, on_error=errors.append)
+        else:
+            text = fetch_blog_content(source, on_error=errors.append)
+        return (split_text_documents(text, chunk_size, chunk_overlap) if text else None), errors
+    return setup_documents(file_hash or hash_file(source), source, chunk_size, chunk_overlap), errors
+
+
+def summarize_item(item, args):
+    """
+    Summarize one item and build its output record.
+    """
+    start = time.perf_counter()
+    record = {"key": item_key(item, args), "source": item["source"], "prompt": item["prompt"]}
+    try:
+        docs, errors = load_item_documents(item["source"], args.chunk_size, args.chunk_overlap, item.get("file_hash"))
+        if not docs:
+            return {**record, "status": "error", "error": "; ".join(errors) or "No text found"}
+        if args.compress:
+            compressor = ExtractiveCompressor(ratio=args.compress, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+            docs, stats = compressor.compress_documents(docs)
+            record["compression"] = stats
+            if not docs:
+                return {**record, "status": "error", "error": "Nothing left after compression"}
+        llm = ChatOpenAI(model_name=args.model, temperature=args.temperature)
+        summaries = custom_summary(docs, llm, item["prompt"], args.chain_type, args.num_summaries)
+        record.update(status="ok", chunks=len(docs), summaries=summaries)
+    except Exception as e:  # one bad item must not stop the batch
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    record["seconds"] = round(time.perf_counter() - start, 2)
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a folder of PDFs or a manifest of PDFs and URLs.")
+    parser.add_argument("input", help="Folder of PDFs, or a .txt / .jsonl manifest")
+    parser.add_argument("--output", default="summaries.jsonl", help="JSONL file the results are appended to")
+    parser.add_argument("--prompt", default="Summarize the key points", help="Custom prompt for items without one")
+    parser.add_argument("--chain-type", default="map_reduce", choices=["map_reduce", "stuff", "refine"])
+    parser.add_argument("--chunk-size", type=int, default=500, help="Chunk size in tokens")
+    parser.add_argument("--chunk-overlap", type=int, default=50, help="Chunk overlap in tokens")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--temperature", type=float, default=0.5)
+    parser.add_argument("--num-summaries", type=int, default=1)
+    parser.add_argument("--compress", type=float, default=None,
+                        help="Pre-compress the text, keeping this share of the tokens (e.g. 0.5)")
+    parser.add_argument("--workers", type=int, default=4, help="Items summarized at once (LLM calls share one rate limiter)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    items = read_items(args.input, args.prompt)
+    for item in items:
+        if not is_url(item["source"]) and os.path.isfile(item["source"]):
+            item["file_hash"] = hash_file(item["source"])  # an edited file is summarized again
+    done = completed_keys(args.output)
+    pending = [item for item in items if item_key(item, args) not in done]
+    print(f"{len(items)} items, {len(items) - len(pending)} already done, {len(pending)} to summarize", file=sys.stderr)
+
+    failed = 0
+    with open(args.output, "a", encoding="utf-8") as output, ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = [executor.submit(summarize_item, item, args) for item in pending]
+        for count, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()  # a killed run keeps every finished item
+            os.fsync(output.fileno())
+            failed += record["status"] != "ok"
+            print(f"[{count}/{len(pending)}] {record['status']} {record['source']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+
+# Root folder for every on-disk cache used by the pages (can be moved with an env variable)
+CACHE_ROOT = os.getenv("ACADEMIAI_CACHE_DIR", ".cache")
+
+
+def cache_dir(name):
+    """
+    Return (and create if needed) the folder of a named cache under CACHE_ROOT.
+    Args:
+        name (str): Name of the cache, e.g. "faiss_indexes".
+    Returns:
+        str: Path to the cache folder.
+    """
+    path = os.path.join(CACHE_ROOT, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def hash_parts(*parts):
+    """
+    Build a stable sha256 hex key out of bytes / str / number parts.
+    Args:
+        *parts: Values that make up the key (order matters).
+    Returns:
+        str: Hex digest of all the parts.
+    """
+    hasher = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode("utf-8")
+        hasher.update(len(part).to_bytes(8, "little"))  # length prefix so ("ab", "c") != ("a", "bc")
+        hasher.update(part)
+    return hasher.hexdigest()
+
+
+def path_size(path):
+    """
+    Size in bytes of a file, or of everything inside a folder.
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                pass  # file removed while walking
+    return total
+
+
+def touch(path):
+    """
+    Mark a cache entry as recently used (the modification time is the LRU clock).
+    """
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+def remove_entry(path):
+    """
+    Delete a cache entry, either a single file or a whole folder.
+    """
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def open_sqlite(name, *schema_sql, db_path=None):
+    """
+    Open the SQLite file of a named cache, shared by every session and thread of the process.
+    Args:
+        name (str): Name of the cache, the file is <CACHE_ROOT>/<name>/<name>.sqlite3.
+        *schema_sql (str): CREATE ... IF NOT EXISTS statements run once.
+        db_path (str): Use this file instead, e.g. for tests.
+    Returns:
+        Tuple[sqlite3.Connection, threading.Lock]: The connection and the lock to hold while using it.
+    """
+    conn = sqlite3.connect(
+        db_path or os.path.join(cache_dir(name), f"{name}.sqlite3"), check_same_thread=False, timeout=30
+    )
+    conn.execute("PRAGMA journal_mode=WAL")  # many sessions read while one writes
+    for statement in schema_sql:
+        conn.execute(statement)
+    conn.commit()
+    return conn, threading.Lock()
+
+
+@contextmanager
+def atomic_write(path):
+    """
+    Write a cache entry aside and move it in place once complete, so readers never see half an entry.
+    Usage:
+        with atomic_write(entry_path) as tmp_path:
+            save_something(tmp_path)
+    Args:
+        path (str): Final path of the entry, a file or a folder.
+    Yields:
+        str: Temporary path in the same folder (skipped by evict_lru) to write the entry to.
+    """
+    tmp_path = os.path.join(os.path.dirname(path), f".tmp-{uuid.uuid4().hex}{os.path.splitext(path)[1]}")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        remove_entry(tmp_path)  # only left over when writing or moving failed
+
+
+def evict_lru(directory, max_bytes, keep=()):
+    """
+    Delete the least recently used entries of a cache folder until it fits in max_bytes.
+    Args:
+        directory (str): Cache folder, every direct child is one entry.
+        max_bytes (int): Size budget for the whole folder.
+        keep (iterable): Entry names that must never be evicted (e.g. the one just written).
+    Returns:
+        int: Number of entries removed.
+    """
+    entries = []
+    for name in os.listdir(directory):
+        if name.startswith(".tmp"):
+            continue  # entry still being written by another session
+        path = os.path.join(directory, name)
+        try:
+            entries.append((os.path.getmtime(path), path_size(path), name, path))
+        except OSError:
+            continue
+    total = sum(size for _, size, _, _ in entries)
+    removed = 0
+    for _, size, name, path in sorted(entries):  # oldest first
+        if total <= max_bytes:
+            break
+        if name in keep:
+            continue
+        remove_entry(path)
+        total -= size
+        removed += 1
+    return removed
+
@@ -0,0 +1,42 @@
+import tiktoken
+from langchain.memory import ConversationSummaryBufferMemory
+
+# Rough number of tokens the chat format adds around each message
+TOKENS_PER_MESSAGE = 4
+
+
+class TokenBudgetMemory(ConversationSummaryBufferMemory):
+    """
+    Conversation memory that stays inside a fixed token budget.
+    The last `max_turns` question/answer turns are kept word for word and older
+    turns are folded into a running summary. The summary is updated only with
+    the turns being dropped, so each follow-up question costs about the same.
+    """
+
+    max_turns: int = 4
+    encoding_name: str = "cl100k_base"
+
+    def count_tokens(self, text):
+        """
+        Count the tokens of a text with tiktoken.
+        """
+        return len(tiktoken.get_encoding(self.encoding_name).encode(text))
+
+    def prune(self):
+        """
+        Drop the oldest turns until the buffer fits in max_turns and max_token_limit
+        (summary included), then fold the dropped turns into the summary.
+        """
+        buffer = self.chat_memory.messages
+        sizes = [self.count_tokens(message.content) + TOKENS_PER_MESSAGE for message in buffer]
+        total = sum(sizes) + self.count_tokens(self.moving_summary_buffer)
+
+        pruned_memory = []
+        # a turn is a question and its answer, the last turn is always kept as is
+        while len(buffer) > 2 and (len(buffer) > 2 * self.max_turns or total > self.max_token_limit):
+            for _ in range(2):
+                pruned_memory.append(buffer.pop(0))
+                total -= sizes.pop(0)
+
+        if pruned_memory:
+            self.moving_summary_buffer = self.predict_new_summary(pruned_memory, self.moving_summary_buffer)
@@ -0,0 +1,81 @@
+import os
+import re
+from io import BytesIO
+
+import openai
+from PIL import Image
+
+from CacheUtils import atomic_write, hash_parts, touch
+from WebFetch import HTTP_TIMEOUT, get_session
+
+# Generated covers are kept here, next to the sample images of the repo
+COVER_ART_DIR = "Generated_Cover_Art_Images"
+COVER_ART_SIZE = "1024x1024"
+COVER_JPEG_QUALITY = 85
+THUMBNAIL_SIZE = (256, 256)
+PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_title(title):
+    """
+    Title used in the cache key: case, punctuation and spacing do not give a new cover.
+    """
+    return " ".join(PUNCTUATION.sub(" ", title.lower()).split())
+
+
+def cover_art_prompt(cover_art_title):
+    return f""" Create an artistic podcast cover for a podcast titled '{cover_art_title}'.
+            It should reflect the topics discussed in the research paper,
+            include things realted to podcasts in the image like Microphone, speaker, Headphones and studio please,
+            NOTE that you dont have to include them all just include what is better for the design, ALSO Include no
+            Text in the cover image"""
+
+
+def cover_art_paths(cover_art_title):
+    """
+    Paths of the cover and its thumbnail for a title.
+    Returns:
+        Tuple[str, str]: (cover path, thumbnail path)
+    """
+    key = hash_parts(normalize_title(cover_art_title), cover_art_prompt("{title}"), COVER_ART_SIZE)[:32]
+    return (os.path.join(COVER_ART_DIR, f"cover-{key}.jpg"), os.path.join(COVER_ART_DIR, f"cover-{key}-thumb.jpg"))
+
+
+def cached_cover_art(cover_art_title):
+    """
+    Cover already generated for a title, or None (never calls the image API).
+    Returns:
+        Tuple[str, str] or None: (cover path, thumbnail path)
+    """
+    cover_path, thumbnail_path = cover_art_paths(cover_art_title)
+    if not (os.path.exists(cover_path) and os.path.exists(thumbnail_path)):
+        return None
+    touch(cover_path)
+    return cover_path, thumbnail_path
+
+
+def generate_cover_art(cover_art_title):
+    """
+    Generate (or reuse) the DALL·E cover of a title, stored as a JPEG with a thumbnail.
+    Returns:
+        Tuple[str, str]: (cover path, thumbnail path)
+    """
+    cached = cached_cover_art(cover_art_title)
+    if cached:
+        return cached
+
+    response = openai.Image.create(prompt=cover_art_prompt(cover_art_title), n=1, size=COVER_ART_SIZE)
+    image_response = get_session().get(response["data"][0]["url"], timeout=HTTP_TIMEOUT)  # pooled, with timeouts
+    image_response.raise_for_status()
+    image = Image.open(BytesIO(image_response.content)).convert("RGB")
+
+    os.makedirs(COVER_ART_DIR, exist_ok=True)
+    cover_path, thumbnail_path = cover_art_paths(cover_art_title)
+    thumbnail = image.copy()
+    thumbnail.thumbnail(THUMBNAIL_SIZE)
+    # thumbnail first: the cover file marks a complete entry for cached_cover_art
+    with atomic_write(thumbnail_path) as tmp_path:
+        thumbnail.save(tmp_path, "JPEG", quality=COVER_JPEG_QUALITY, optimize=True)
+    with atomic_write(cover_path) as tmp_path:
+        image.save(tmp_path, "JPEG", quality=COVER_JPEG_QUALITY, optimize=True)
+    return cover_path, thumbnail_path
@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from CacheUtils import hash_parts, open_sqlite
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wrap an embeddings model with a local SQLite store of chunk vectors.
+    Chunks are deduplicated and only the ones missing from the store are sent
+    to the model, in batches and with a bounded number of parallel requests.
+    Queries are only memoized in memory, so the answer cache lookup and the retriever embed a question once.
+    """
+
+    def __init__(self, embeddings, batch_size=256, max_workers=4, db_path=None, query_cache_size=256):
+        """
+        Args:
+            embeddings (Embeddings): The real model (e.g. OpenAIEmbeddings).
+            batch_size (int): Number of texts sent in one embedding request.
+            max_workers (int): Maximum number of embedding requests running at once.
+            db_path (str): SQLite file, defaults to the "embeddings" cache.
+            query_cache_size (int): Number of recent query vectors kept in memory.
+        """
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.hits = 0
+        self.misses = 0
+        self._conn, self._lock = open_sqlite(
+            "embeddings", "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT, vector BLOB)", db_path=db_path
+        )
+        self._embed_query = lru_cache(maxsize=query_cache_size)(lambda text: tuple(self.embeddings.embed_query(text)))
+
+    def _key(self, text):
+        return hash_parts(self.model, text)
+
+    def _lookup(self, keys):
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):  # stay under the SQLite variable limit
+                part = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _store(self, items):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                [(key, self.model, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items],
+            )
+            self._conn.commit()
+
+    def _embed_batch(self, keys, texts):
+        vectors = self.embeddings.embed_documents(texts)
+        self._store(zip(keys, vectors))  # save each batch as soon as it arrives
+        return vectors
+
+    def embed_documents(self, texts):
+        """
+        Embed a list of texts, reusing stored vectors and embedding each unique miss once.
+        Args:
+            texts (List[str]): Texts to embed.
+        Returns:
+            List[List[float]]: One vector per input text, in the same order.
+        """
+        keys = [self._key(text) for text in texts]
+        unique = dict(zip(keys, texts))  # dedupe identical chunks
+        vectors = self._lookup(list(unique))
+
+        missing_keys = [key for key in unique if key not in vectors]
+        self.hits += len(unique) - len(missing_keys)
+        self.misses += len(missing_keys)
+
+        batches = [missing_keys[i:i + self.batch_size] for i in range(0, len(missing_keys), self.batch_size)]
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                results = executor.map(lambda batch: self._embed_batch(batch, [unique[k] for k in batch]), batches)
+                for batch, batch_vectors in zip(batches, results):
+                    vectors.update(zip(batch, batch_vectors))
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        """
+        Embed a single query with the wrapped model, memoized in memory but never written to the store.
+        """
+        return list(self._embed_query(text))
@@ -0,0 +1,249 @@
+import re
+import time
+from collections import Counter
+
+import numpy as np
+import tiktoken
+from langchain.docstore.document import Document
+
+from TextSplitter import SENTENCE_BOUNDARY, SentenceTokenSplitter, tokenize
+
+# Headings of sections that add little to a summary; the section runs until the next section heading
+BOILERPLATE_HEADING = re.compile(
+    r"^\s*(?:\d+(?:\.\d+)*\.?\s+|[IVX]+\.\s+)?(?:references|bibliography|works cited|acknowledge?ments?|funding|"
+    r"conflicts? of interest|competing interests?|author contributions?|declarations?)\s*:?\s*$",
+    re.IGNORECASE,
+)
+SECTION_HEADING = re.compile(
+    r"^\s*(?:(?:\d+(?:\.\d+)*\.?|[IVX]+\.)\s+[A-Z][^.!?]{0,80}"  # 2.1 Methods, IV. Results
+    r"|(?i:chapter|appendix|part|section)\s+(?:\d+|[A-Z])\b[^.!?]{0,80}"  # Chapter 2 Methods, Appendix A
+    r"|[A-Z][A-Za-z-]*(?:\s+(?:[A-Z][A-Za-z-]*|and|of|the|for|in|on|&)){0,4}"  # Results, Materials and Methods
+    r")\s*:?\s*$"
+)
+DIGITS = re.compile(r"\d+")
+STOP_WORDS = frozenset(
+    "a an and are as at be been but by can could did do does for from had has have he her his how i if in into is it "
+    "its may more most no not of on or our she should so such than that the their them then there these they this "
+    "those to was we were what when where which while who will with would you your also however thus using used".split()
+)
+
+
+def normalize_line(line):
+    """
+    Line key used to spot running headers and footers (page numbers ignored).
+    """
+    return DIGITS.sub("#", line.strip().lower())
+
+
+def find_repeated_lines(texts, min_share=0.3, min_count=3, max_chars=100):
+    """
+    Short lines found in many of the texts, i.e. running headers, footers and watermarks.
+    Args:
+        texts (List[str]): Page or chunk texts.
+        min_share (float): Share of the texts a line must appear in.
+        min_count (int): Minimum number of texts a line must appear in.
+        max_chars (int): Longer lines are never treated as headers.
+    Returns:
+        set: Normalized repeated lines.
+    """
+    counts = Counter()
+    for text in texts:
+        counts.update({normalize_line(line) for line in text.splitlines() if 0 < len(line.strip()) <= max_chars})
+    threshold = max(min_count, min_share * len(texts))
+    return {line for line, count in counts.items() if count >= threshold}
+
+
+def strip_boilerplate(texts, max_section_lines=400):
+    """
+    Remove running headers / footers and boilerplate sections (references, acknowledgements, ...).
+    The texts are read in order, so a references section can span several pages.
+    Args:
+        texts (List[str]): Page or chunk texts.
+        max_section_lines (int): A boilerplate section never runs longer than this, in case its end is missed.
+    Returns:
+        List[str]: Cleaned texts, one per input text.
+    """
+    repeated = find_repeated_lines(texts)
+    cleaned = []
+    in_boilerplate = False
+    section_lines = 0
+    for text in texts:
+        kept = []
+        for line in text.splitlines():
+            if BOILERPLATE_HEADING.match(line):
+                in_boilerplate = True
+                section_lines = 0
+            elif in_boilerplate and (SECTION_HEADING.match(line) or section_lines >= max_section_lines):
+                in_boilerplate = False
+            elif in_boilerplate:
+                section_lines += 1
+            if not in_boilerplate and normalize_line(line) not in repeated:
+                kept.append(line)
+        cleaned.append("\n".join(kept))
+    return cleaned
+
+
+def tfidf_matrix(sentences):
+    """
+    Sparse, L2-normalized TF-IDF rows of the sentences as flat (row, column, value) arrays.
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, int]: rows, columns, values and vocabulary size.
+    """
+    vocabulary = {}
+    rows, columns, counts = [], [], []
+    for row, sentence in enumerate(sentences):
+        terms = Counter(term for term in tokenize(sentence) if len(term) > 1 and term not in STOP_WORDS)
+        for term, count in terms.items():
+            rows.append(row)
+            columns.append(vocabulary.setdefault(term, len(vocabulary)))
+            counts.append(count)
+    rows = np.asarray(rows, dtype=np.int64)
+    columns = np.asarray(columns, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.float64)
+
+    document_frequency = np.bincount(columns, minlength=len(vocabulary))
+    idf = np.log((len(sentences) + 1) / (document_frequency + 1)) + 1
+    values = (1 + np.log(counts)) * idf[columns] if len(counts) else counts
+    norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=len(sentences)))
+    values = values / norms[rows] if len(values) else values
+    return rows, columns, values, len(vocabulary)
+
+
+def textrank_scores(rows, columns, values, sentence_count, term_count, damping=0.85, iterations=50, tolerance=1e-6):
+    """
+    TextRank over the cosine similarity graph of the sentences.
+    The n x n similarity matrix is never built: S @ x is computed as X @ (X.T @ x)
+    with two bincounts, so memory stays linear in the number of terms.
+    """
+    def similarity_dot(x):
+        term_weights = np.bincount(columns, weights=values * x[rows], minlength=term_count)
+        return np.bincount(rows, weights=values * term_weights[columns], minlength=sentence_count) - self_similarity * x
+
+    self_similarity = np.bincount(rows, weights=values ** 2, minlength=sentence_count)  # no self loops
+    degree = similarity_dot(np.ones(sentence_count))
+    inverse_degree = np.divide(1.0, degree, out=np.zeros(sentence_count), where=degree > 1e-12)
+    scores = np.full(sentence_count, 1.0 / sentence_count)
+    for _ in range(iterations):
+        new_scores = (1 - damping) / sentence_count + damping * similarity_dot(scores * inverse_degree)
+        if np.abs(new_scores - scores).sum() < tolerance:
+            return new_scores
+        scores = new_scores
+    return scores
+
+
+def centroid_scores(rows, columns, values, sentence_count, term_count):
+    """
+    Cosine similarity of each sentence with the TF-IDF centroid of the whole text.
+    """
+    centroid = np.bincount(columns, weights=values, minlength=term_count)
+    centroid /= np.linalg.norm(centroid) or 1.0
+    return np.bincount(rows, weights=values * centroid[columns], minlength=sentence_count)
+
+
+def rank_sentences(sentences):
+    """
+    Score sentences by importance, an even blend of TextRank and similarity to the centroid.
+    Returns:
+        np.ndarray: One score per sentence, higher is more important.
+    """
+    rows, columns, values, term_count = tfidf_matrix(sentences)
+    if not term_count:
+        return np.zeros(len(sentences))
+    ranks = textrank_scores(rows, columns, values, len(sentences), term_count)
+    centrality = centroid_scores(rows, columns, values, len(sentences), term_count)
+    return 0.5 * ranks / (ranks.max() or 1.0) + 0.5 * centrality / (centrality.max() or 1.0)
+
+
+class ExtractiveCompressor:
+    """
+    Pre-stage for the summarization chains: drop boilerplate, then keep only the
+    highest ranked sentences that fit in a token budget, in their original order.
+    The kept sentences are packed into full-size chunks, so the map phase makes fewer calls.
+    """
+
+    def __init__(self, ratio=0.5, max_tokens=None, drop_boilerplate=True, encoding_name="cl100k_base",
+                 chunk_size=None, chunk_overlap=0):
+        """
+        Args:
+            ratio (float): Share of the input tokens to keep.
+            max_tokens (int): Hard cap on the kept tokens, or None.
+            drop_boilerplate (bool): Remove headers, footers, references and acknowledgements first.
+            encoding_name (str): tiktoken encoding used to count tokens.
+            chunk_size (int): Size in tokens of the output chunks, or None to keep one chunk per input chunk.
+            chunk_overlap (int): Overlap in tokens of the output chunks.
+        """
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.drop_boilerplate = drop_boilerplate
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.encoding_name = encoding_name
+        self._encoding = None
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            self._encoding = tiktoken.get_encoding(self.encoding_name)
+        return self._encoding
+
+    def count_tokens(self, text):
+        return len(self.encoding.encode_ordinary(text))
+
+    def compress_documents(self, docs):
+        """
+        Compress a list of chunks.
+        Args:
+            docs (List[Document]): Chunks in document order.
+        Returns:
+            Tuple[List[Document], dict]: Compressed chunks (repacked to chunk_size, or one per input
+            chunk with its metadata when chunk_size is None) and stats with tokens_before, tokens_after,
+            sentences_before, sentences_after, chunks_before, chunks_after and seconds.
+        """
+        start = time.perf_counter()
+        texts = [doc.page_content for doc in docs]
+        tokens_before = sum(self.count_tokens(text) for text in texts)
+        if self.drop_boilerplate:
+            texts = strip_boilerplate(texts)
+
+        # sentences of every chunk, the copies repeated by the chunk overlap are kept once
+        sentences, owners, seen = [], [], set()
+        for doc_index, text in enumerate(texts):
+            for sentence in SENTENCE_BOUNDARY.split(text):
+                sentence = " ".join(sentence.split())
+                if sentence and sentence not in seen:
+                    seen.add(sentence)
+                    sentences.append(sentence)
+                    owners.append(doc_index)
+
+        budget = int(tokens_before * self.ratio)
+        if self.max_tokens is not None:
+            budget = min(budget, self.max_tokens)
+        sentence_tokens = np.array([self.count_tokens(sentence) for sentence in sentences], dtype=np.int64)
+        keep = np.zeros(len(sentences), dtype=bool)
+        if sentence_tokens.sum() <= budget:
+            keep[:] = True
+        elif sentences:
+            used = 0
+            for index in np.argsort(-rank_sentences(sentences), kind="stable"):
+                if used + sentence_tokens[index] <= budget:
+                    keep[index] = True
+                    used += sentence_tokens[index]
+
+        kept_by_doc = {}
+        for sentence, owner, kept in zip(sentences, owners, keep):
+            if kept:
+                kept_by_doc.setdefault(owner, []).append(sentence)
+        compressed = [Document(page_content=" ".join(kept_by_doc[i]), metadata=docs[i].metadata) for i in sorted(kept_by_doc)]
+        if self.chunk_size is not None and compressed:
+            splitter = SentenceTokenSplitter(self.chunk_size, self.chunk_overlap, self.encoding_name)
+            compressed = splitter.create_documents(["\n\n".join(doc.page_content for doc in compressed)])
+        stats = {
+            "tokens_before": int(tokens_before),
+            "tokens_after": int(sentence_tokens[keep].sum()),
+            "sentences_before": len(sentences),
+            "sentences_after": int(keep.sum()),
+            "chunks_before": len(docs),
+            "chunks_after": len(compressed),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        return compressed, stats
@@ -0,0 +1,139 @@
+import json
+import os
+from collections import Counter
+
+import numpy as np
+from langchain.schema import BaseRetriever
+
+from TextSplitter import tokenize
+
+
+class BM25Index:
+    """
+    In-process inverted index scored with BM25.
+    Postings are stored in flat NumPy arrays (one slice per term) so a query
+    only touches the postings of its own terms.
+    """
+
+    def __init__(self, doc_ids, texts, k1=1.5, b=0.75):
+        """
+        Args:
+            doc_ids (List[str]): Id of each document (returned by search).
+            texts (List[str]): Text of each document.
+            k1 (float): Term frequency saturation.
+            b (float): Document length normalization.
+        """
+        self.doc_ids = list(doc_ids)
+        self.term_ids = {}
+        rows_term, rows_doc, rows_tf = [], [], []
+        doc_lengths = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for doc_index, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[doc_index] = sum(counts.values())
+            for term, tf in counts.items():
+                rows_term.append(self.term_ids.setdefault(term, len(self.term_ids)))
+                rows_doc.append(doc_index)
+                rows_tf.append(tf)
+
+        # group the (term, doc, tf) rows by term: postings of term t are [offsets[t], offsets[t + 1])
+        terms = np.array(rows_term, dtype=np.int64)
+        order = np.argsort(terms, kind="stable")
+        self.postings_docs = np.array(rows_doc, dtype=np.int32)[order]
+        self.postings_tfs = np.array(rows_tf, dtype=np.float32)[order]
+        self.offsets = np.zeros(len(self.term_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self.term_ids)), out=self.offsets[1:])
+
+        doc_count = len(self.doc_ids)
+        doc_freqs = np.diff(self.offsets).astype(np.float32)
+        self.idf = np.log(1 + (doc_count - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        average_length = doc_lengths.mean() if doc_count and doc_lengths.mean() > 0 else 1.0
+        self.k1 = k1
+        self.length_norm = k1 * (1 - b + b * doc_lengths / average_length)  # precomputed per document
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, **kwargs):
+        """
+        Build the index from the documents of a FAISS vectorstore (same ids as its docstore).
+        """
+        doc_ids = list(vectorstore.index_to_docstore_id.values())
+        texts = [vectorstore.docstore.search(doc_id).page_content for doc_id in doc_ids]
+        return cls(doc_ids, texts, **kwargs)
+
+    def save(self, folder_path):
+        """
+        Save the index arrays in a folder (bm25.npz and bm25.json), e.g. next to a saved FAISS index.
+        """
+        np.savez(os.path.join(folder_path, "bm25.npz"), postings_docs=self.postings_docs, postings_tfs=self.postings_tfs,
+                 offsets=self.offsets, idf=self.idf, length_norm=self.length_norm)
+        terms = sorted(self.term_ids, key=self.term_ids.get)  # term of each id, in id order
+        with open(os.path.join(folder_path, "bm25.json"), "w", encoding="utf-8") as f:
+            json.dump({"doc_ids": self.doc_ids, "terms": terms, "k1": self.k1}, f)
+
+    @classmethod
+    def load(cls, folder_path):
+        """
+        Load an index saved with save, without tokenizing the documents again.
+        """
+        with open(os.path.join(folder_path, "bm25.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls.__new__(cls)
+        index.doc_ids = meta["doc_ids"]
+        index.term_ids = {term: term_id for term_id, term in enumerate(meta["terms"])}
+        index.k1 = meta["k1"]
+        with np.load(os.path.join(folder_path, "bm25.npz")) as arrays:
+            for name in ("postings_docs", "postings_tfs", "offsets", "idf", "length_norm"):
+                setattr(index, name, arrays[name])
+        return index
+
+    def search(self, query, k=4):
+        """
+        Return the k best documents for a query.
+        Returns:
+            List[Tuple[str, float]]: (document id, BM25 score), best first.
+        """
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.postings_docs[start:end]
+            tfs = self.postings_tfs[start:end]
+            scores[docs] += self.idf[term_id] * tfs * (self.k1 + 1) / (tfs + self.length_norm[docs])
+
+        matched = np.flatnonzero(scores)
+        top = matched[np.argsort(-scores[matched], kind="stable")[:k]]
+        return [(self.doc_ids[i], float(scores[i])) for i in top]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever that fuses BM25 and FAISS results with reciprocal-rank fusion.
+    """
+
+    vectorstore: object
+    bm25: BM25Index
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def dense_search(self, query):
+        """
+        Docstore ids of the fetch_k nearest chunks in the FAISS index.
+        """
+        embedding = np.array([self.vectorstore.embedding_function(query)], dtype=np.float32)
+        _, indices = self.vectorstore.index.search(embedding, self.fetch_k)
+        return [self.vectorstore.index_to_docstore_id[i] for i in indices[0] if i != -1]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        fused = {}
+        lexical_ids = [doc_id for doc_id, _ in self.bm25.search(query, self.fetch_k)]
+        for ranking in (self.dense_search(query), lexical_ids):
+            for rank, doc_id in enumerate(ranking):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        best_ids = sorted(fused, key=fused.get, reverse=True)[:self.k]
+        return [self.vectorstore.docstore.search(doc_id) for doc_id in best_ids]
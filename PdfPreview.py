@@ -0,0 +1,63 @@
+import os
+import threading
+
+import pypdfium2 as pdfium
+
+from CacheUtils import atomic_write, cache_dir, evict_lru, touch
+
+# Width in pixels of the preview images (the pages are downscaled to it)
+PREVIEW_WIDTH = int(os.getenv("PDF_PREVIEW_WIDTH", "850"))
+PREVIEW_JPEG_QUALITY = 80
+# Size budget of the rendered pages shared by every session
+PREVIEW_CACHE_MAX_MB = int(os.getenv("PDF_PREVIEW_CACHE_MAX_MB", "256"))
+
+# pdfium is not thread safe and Streamlit sessions run in threads
+_pdfium_lock = threading.Lock()
+
+
+def page_count(pdf_path):
+    """
+    Number of pages of a PDF (only the cross-reference table is read).
+    """
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+
+def render_pages(file_hash, pdf_path, first_page, last_page, width=PREVIEW_WIDTH):
+    """
+    Render a range of pages to downscaled JPEG files, reusing the ones already in the disk cache.
+    Args:
+        file_hash (str): sha256 of the PDF bytes, used in the cache key.
+        pdf_path (str): Path to the PDF file.
+        first_page (int): First page to render, starting at 1.
+        last_page (int): Last page to render (included).
+        width (int): Width of the images in pixels.
+    Returns:
+        List[str]: Path of the image of each page, in order.
+    """
+    preview_cache = cache_dir("pdf_previews")
+    paths = [os.path.join(preview_cache, f"{file_hash}-{page}-{width}.jpg") for page in range(first_page, last_page + 1)]
+    missing = [(page, path) for page, path in zip(range(first_page, last_page + 1), paths) if not os.path.exists(path)]
+    for path in paths:
+        if os.path.exists(path):
+            touch(path)  # mark the page as recently used
+    if not missing:
+        return paths
+
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            for page_number, path in missing:
+                page = pdf[page_number - 1]
+                image = page.render(scale=width / page.get_width()).to_pil()
+                page.close()
+                with atomic_write(path) as tmp_path:
+                    image.convert("RGB").save(tmp_path, "JPEG", quality=PREVIEW_JPEG_QUALITY, optimize=True)
+        finally:
+            pdf.close()
+    evict_lru(preview_cache, PREVIEW_CACHE_MAX_MB * 1024 * 1024, keep={os.path.basename(path) for path in paths})
+    return paths
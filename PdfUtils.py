@@ -0,0 +1,133 @@
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from io import BytesIO
+
+from PyPDF2 import PdfReader
+
+from CacheUtils import atomic_write, cache_dir, evict_lru, hash_parts, touch
+
+# Below this many pages in total a process pool costs more than it saves
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+# Number of pages parsed by one worker task (each task re-opens the PDF from a temporary file)
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# Size budget of the extracted texts shared by every session
+PDF_TEXT_CACHE_MAX_MB = int(os.getenv("PDF_TEXT_CACHE_MAX_MB", "256"))
+
+
+# One worker pool per process, started on first use and reused by every upload
+@lru_cache(maxsize=None)
+def get_process_pool(max_workers=None):
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+
+def _extract_page_range(source, start, end, engine="pypdf2"):
+    """
+    Extract the text of pages [start, end) of a PDF (runs inside a worker process).
+    Args:
+        source: Path of the PDF in a worker process, or a file object when run in-process.
+    """
+    if engine == "pdfplumber":
+        import pdfplumber  # only the pages that use this engine pay for the import
+        with pdfplumber.open(source) as pdf:
+            return [pdf.pages[i].extract_text() or "" for i in range(start, end)]  # scanned pages return None
+    reader = PdfReader(source)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]  # scanned pages return None
+
+
+def _spool_pdfs(pdfs):
+    """
+    Write each PDF to a temporary file once, so worker tasks get a path instead of the whole bytes.
+    Returns:
+        Dict[int, str]: Temporary file path by index in pdfs.
+    """
+    paths = {}
+    for i, (_, pdf_bytes) in enumerate(pdfs):
+        fd, paths[i] = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+    return paths
+
+
+def iter_pdf_pages(pdfs, max_workers=None, engine="pypdf2"):
+    """
+    Extract the pages of several PDFs in parallel and yield them in order as soon as they are ready.
+    Args:
+        pdfs (List[Tuple[str, bytes]]): (file name, PDF bytes) pairs.
+        max_workers (int): Number of worker processes (defaults to the number of CPUs).
+        engine (str): "pypdf2" or "pdfplumber" (slower, better layout for some papers).
+    Yields:
+        Tuple[str, int, str]: (file name, page number starting at 1, page text).
+    """
+    tasks = []  # (file name, index in pdfs, first page, last page + 1)
+    for i, (name, pdf_bytes) in enumerate(pdfs):
+        page_count = len(PdfReader(BytesIO(pdf_bytes)).pages)
+        for start in range(0, page_count, PAGES_PER_TASK):
+            tasks.append((name, i, start, min(start + PAGES_PER_TASK, page_count)))
+
+    total_pages = sum(end - start for _, _, start, end in tasks)
+    if total_pages < PARALLEL_MIN_PAGES or len(tasks) == 1:
+        for name, i, start, end in tasks:
+            for offset, text in enumerate(_extract_page_range(BytesIO(pdfs[i][1]), start, end, engine)):
+                yield name, start + offset + 1, text
+        return
+
+    paths = _spool_pdfs(pdfs)
+    executor = get_process_pool(max_workers)
+    futures = []
+    try:
+        futures = [executor.submit(_extract_page_range, paths[i], start, end, engine) for _, i, start, end in tasks]
+        for (name, _, start, _), future in zip(tasks, futures):
+            for offset, text in enumerate(future.result()):  # waits only for the next range in order
+                yield name, start + offset + 1, text
+    except BrokenProcessPool:
+        get_process_pool.cache_clear()  # a worker died, start a new pool next time
+        raise
+    finally:
+        for future in futures:
+            future.cancel()  # the consumer stopped early
+        for path in paths.values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # still open in a worker that is finishing a cancelled range
+
+
+def load_pdf_texts(pdfs, engine="pypdf2", max_workers=None):
+    """
+    Text of each PDF, cached on disk by content hash and shared by every session.
+    The PDFs missing from the cache are parsed together, pages in parallel across processes.
+    Args:
+        pdfs (List[Tuple[str, bytes]]): (file name, PDF bytes) pairs.
+        engine (str): Extraction engine, part of the cache key.
+        max_workers (int): Number of worker processes.
+    Returns:
+        List[List[str]]: Page texts of each PDF, in order.
+    """
+    text_cache = cache_dir("pdf_texts")
+    entry_names = [f"{hash_parts(pdf_bytes, engine)}.json" for _, pdf_bytes in pdfs]
+    texts = [None] * len(pdfs)
+    for i, entry_name in enumerate(entry_names):
+        try:
+            with open(os.path.join(text_cache, entry_name), encoding="utf-8") as f:
+                texts[i] = json.load(f)
+            touch(os.path.join(text_cache, entry_name))  # mark the entry as recently used
+        except (OSError, ValueError):
+            pass
+
+    missing = [i for i, pages in enumerate(texts) if pages is None]
+    if not missing:
+        return texts
+    for i in missing:
+        texts[i] = []
+    names = {f"{i}": i for i in missing}  # unique names, the same file name may be uploaded twice
+    for name, _, text in iter_pdf_pages([(f"{i}", pdfs[i][1]) for i in missing], max_workers, engine):
+        texts[names[name]].append(text)
+    for i in missing:
+        with atomic_write(os.path.join(text_cache, entry_names[i])) as tmp_path, open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(texts[i], f)
+    evict_lru(text_cache, PDF_TEXT_CACHE_MAX_MB * 1024 * 1024, keep=set(entry_names))
+    return texts
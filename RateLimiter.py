@@ -0,0 +1,65 @@
+import asyncio
+import random
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket limiter for per-minute request and token limits (e.g. the OpenAI ones).
+    Callers reserve capacity up front and sleep for as long as the buckets are in debt,
+    so concurrent callers queue up instead of all hitting a 429 at once.
+    Works from threads (acquire) and from asyncio code (aacquire).
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        """
+        Args:
+            requests_per_minute (int): Maximum requests per minute.
+            tokens_per_minute (int): Maximum tokens (prompt + completion) per minute.
+        """
+        self.request_rate = requests_per_minute / 60.0
+        self.token_rate = tokens_per_minute / 60.0
+        self.request_capacity = float(requests_per_minute)
+        self.token_capacity = float(tokens_per_minute)
+        self.requests = self.request_capacity
+        self.tokens = self.token_capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        """
+        Take one request and some tokens from the buckets and return how long to wait for them.
+        """
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self.updated
+            self.updated = now
+            self.requests = min(self.request_capacity, self.requests + elapsed * self.request_rate)
+            self.tokens = min(self.token_capacity, self.tokens + elapsed * self.token_rate)
+            self.requests -= 1
+            self.tokens -= min(tokens, self.token_capacity)  # a single call bigger than the bucket waits one full minute
+            return max(0.0, -self.requests / self.request_rate, -self.tokens / self.token_rate)
+
+    def acquire(self, tokens=0):
+        """
+        Block the calling thread until the request fits in the limits.
+        """
+        wait = self._reserve(tokens)
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens=0):
+        """
+        Wait (without blocking the event loop) until the request fits in the limits.
+        """
+        wait = self._reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+
+def backoff_delay(attempt, base=1.0, maximum=60.0):
+    """
+    Exponential backoff with full jitter for retry number `attempt` (starting at 0).
+    """
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
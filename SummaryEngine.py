@@ -0,0 +1,316 @@
+import asyncio
+import time
+
+import openai
+from langchain.chat_models import ChatOpenAI
+from langchain.docstore.document import Document
+from langchain.schema import HumanMessage
+
+from CacheUtils import hash_parts, open_sqlite
+from RateLimiter import backoff_delay
+
+# Errors worth retrying: 429s, timeouts and temporary server errors
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIError,
+)
+
+# Completion tokens reserved in the rate limiter for each map call
+MAP_OUTPUT_TOKENS = 300
+# Separator between documents in one prompt (same as the LangChain stuff chain)
+DOCUMENT_SEPARATOR = "\n\n"
+# Safety stop for the tree reduce, each level divides the number of texts by the batch size
+MAX_REDUCE_LEVELS = 10
+
+
+class MapOutputStore:
+    """
+    On-disk store of map outputs, keyed by chunk text, map prompt, model and temperature.
+    Summarizing the same document again (e.g. with a new combine prompt) reuses them,
+    so only the reduce step calls the LLM.
+    """
+
+    def __init__(self, max_entries=200000, db_path=None):
+        """
+        Args:
+            max_entries (int): Number of outputs kept, the least recently used are evicted.
+            db_path (str): SQLite file, defaults to the "map_outputs" cache.
+        """
+        self.max_entries = max_entries
+        self._conn, self._lock = open_sqlite(
+            "map_outputs", "CREATE TABLE IF NOT EXISTS map_outputs (key TEXT PRIMARY KEY, output TEXT, last_used REAL)", db_path=db_path
+        )
+
+    @staticmethod
+    def key(text, map_prompt, llm):
+        """
+        Key of one map call: same chunk, prompt, model and temperature give the same key.
+        """
+        model = getattr(llm, "model_name", type(llm).__name__)
+        return hash_parts(text, map_prompt.template, model, getattr(llm, "temperature", None))
+
+    def get_many(self, keys):
+        """
+        Stored outputs of some keys, as a {key: output} dict of the hits.
+        """
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):  # stay under the SQLite variable limit
+                part = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, output FROM map_outputs WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update(rows)
+            self._conn.executemany("UPDATE map_outputs SET last_used = ? WHERE key = ?", [(time.time(), k) for k in found])
+            self._conn.commit()
+        return found
+
+    def put(self, key, output):
+        """
+        Save one map output.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO map_outputs (key, output, last_used) VALUES (?, ?, ?)", (key, output, time.time())
+            )
+            self._conn.commit()
+
+    def evict(self):
+        """
+        Keep only the max_entries most recently used outputs.
+        """
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM map_outputs WHERE key IN (SELECT key FROM map_outputs ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+
+def llm_with(llm, **changes):
+    """
+    Copy of a LangChain model with some fields changed.
+    (pydantic copy() would drop the excluded fields such as callbacks.)
+    """
+    fields = {name: getattr(llm, name) for name in llm.__fields__}
+    return type(llm)(**{**fields, **changes})
+
+
+async def acall_llm(llm, prompt_text, rate_limiter=None, max_retries=5, output_tokens=MAP_OUTPUT_TOKENS):
+    """
+    Call the LLM on one prompt, waiting for the rate limiter and retrying with backoff on 429s.
+    Args:
+        llm: LangChain chat model.
+        prompt_text (str): The formatted prompt.
+        rate_limiter (RateLimiter): Shared per-minute limits, or None.
+        max_retries (int): Retries before the error is raised.
+        output_tokens (int): Completion tokens to reserve in the rate limiter.
+    Returns:
+        str: The LLM answer.
+    """
+    tokens = llm.get_num_tokens(prompt_text) + output_tokens if rate_limiter else 0
+    for attempt in range(max_retries + 1):
+        if rate_limiter:
+            await rate_limiter.aacquire(tokens)
+        try:
+            return await llm.apredict(prompt_text)
+        except RETRYABLE_ERRORS:
+            if attempt == max_retries:
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+
+
+async def amap_documents(docs, llm, map_prompt, max_concurrency=8, rate_limiter=None, on_progress=None, store=None):
+    """
+    Run the map prompt over every document concurrently.
+    Outputs already in the store are reused and new ones are saved as they arrive.
+    Args:
+        docs (List[Document]): Text chunks to map.
+        llm: LangChain chat model (its own retries are turned off, retries happen here).
+        map_prompt (PromptTemplate): Prompt with a {text} variable.
+        max_concurrency (int): Maximum number of LLM calls running at once.
+        rate_limiter (RateLimiter): Shared per-minute limits, or None.
+        on_progress (callable): Called with (done, total) after each finished call.
+        store (MapOutputStore): Persistent map outputs, or None.
+    Returns:
+        List[str]: The map output of each document, in the same order.
+    """
+    keys = [MapOutputStore.key(doc.page_content, map_prompt, llm) for doc in docs] if store else []
+    stored = store.get_many(list(set(keys))) if store else {}
+    if "max_retries" in llm.__fields__:
+        llm = llm_with(llm, max_retries=0)  # avoid retries inside retries
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    done = 0
+
+    async def map_one(i, doc):
+        nonlocal done
+        if store and keys[i] in stored:
+            output = stored[keys[i]]
+        else:
+            async with semaphore:
+                output = await acall_llm(llm, map_prompt.format(text=doc.page_content), rate_limiter)
+            if store:
+                store.put(keys[i], output)
+        done += 1
+        if on_progress:
+            on_progress(done, len(docs))
+        return output
+
+    outputs = await asyncio.gather(*(map_one(i, doc) for i, doc in enumerate(docs)))
+    if store:
+        store.evict()
+    return outputs
+
+
+def run_map_phase(docs, llm, map_prompt, max_concurrency=8, rate_limiter=None, on_progress=None, store=None):
+    """
+    Synchronous entry point of amap_documents (for the Streamlit script thread).
+    """
+    return asyncio.run(amap_documents(docs, llm, map_prompt, max_concurrency, rate_limiter, on_progress, store))
+
+
+def batch_by_tokens(texts, llm, prompt, token_max):
+    """
+    Group consecutive texts into batches whose prompt stays within token_max.
+    A text too long for any batch gets a batch of its own.
+    Args:
+        texts (List[str]): Texts to group, in order.
+        llm: LangChain chat model (counts the tokens).
+        prompt (PromptTemplate): Prompt with a {text} variable the batches are sent with.
+        token_max (int): Largest prompt in tokens.
+    Returns:
+        List[List[str]]: The batches, in order.
+    """
+    overhead = llm.get_num_tokens(prompt.format(text=""))
+    separator_tokens = llm.get_num_tokens(DOCUMENT_SEPARATOR)
+    batches, current, used = [], [], overhead
+    for text in texts:
+        tokens = llm.get_num_tokens(text) + separator_tokens
+        if current and used + tokens > token_max:
+            batches.append(current)
+            current, used = [], overhead
+        current.append(text)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def atree_reduce(texts, llm, collapse_prompt, combine_prompt, token_max, max_concurrency=8,
+                       rate_limiter=None, on_progress=None, store=None):
+    """
+    Collapse intermediate summaries level by level until they fit in one combine prompt.
+    Each level groups the texts into token-bounded batches and summarizes every batch
+    concurrently, so a book takes a few levels instead of one sequential pass.
+    Args:
+        texts (List[str]): Intermediate summaries (e.g. the map outputs), in document order.
+        llm: LangChain chat model.
+        collapse_prompt (PromptTemplate): Prompt used inside the tree, with a {text} variable.
+        combine_prompt (PromptTemplate): Final prompt the remaining texts must fit in.
+        token_max (int): Largest prompt in tokens.
+        max_concurrency (int): Maximum number of LLM calls running at once.
+        rate_limiter (RateLimiter): Shared per-minute limits, or None.
+        on_progress (callable): Called with (done, total, level) after each finished call.
+        store (MapOutputStore): Persistent outputs (reused across runs like the map outputs), or None.
+    Returns:
+        List[str]: Texts that fit together in combine_prompt.
+    """
+    level = 0
+    while len(batch_by_tokens(texts, llm, combine_prompt, token_max)) > 1 and level < MAX_REDUCE_LEVELS:
+        level += 1
+        batches = batch_by_tokens(texts, llm, collapse_prompt, token_max)
+        level_progress = (lambda done, total, level=level: on_progress(done, total, level)) if on_progress else None
+        docs = [Document(page_content=DOCUMENT_SEPARATOR.join(batch)) for batch in batches]
+        texts = await amap_documents(docs, llm, collapse_prompt, max_concurrency, rate_limiter, level_progress, store)
+    return texts
+
+
+def run_tree_reduce(texts, llm, collapse_prompt, combine_prompt, token_max, max_concurrency=8,
+                    rate_limiter=None, on_progress=None, store=None):
+    """
+    Synchronous entry point of atree_reduce.
+    """
+    return asyncio.run(atree_reduce(texts, llm, collapse_prompt, combine_prompt, token_max, max_concurrency,
+                                    rate_limiter, on_progress, store))
+
+
+def supports_n(llm):
+    """
+    Check if the model can return several completions of one prompt (OpenAI `n` parameter).
+    """
+    return isinstance(llm, ChatOpenAI) and not llm.streaming
+
+
+async def agenerate_n(llm, prompt_text, n, rate_limiter=None):
+    """
+    Get n completions of one prompt in a single request.
+    Returns:
+        List[str]: The n completions.
+    """
+    llm = llm_with(llm, n=n)
+    if rate_limiter:
+        await rate_limiter.aacquire(llm.get_num_tokens(prompt_text) + n * MAP_OUTPUT_TOKENS)
+    result = await llm.agenerate([[HumanMessage(content=prompt_text)]])
+    return [generation.text for generation in result.generations[0]]
+
+
+async def acall_chain(chain, docs, llm, rate_limiter=None, calls=1):
+    """
+    Run a combine documents chain once, taking the rate limiter for the calls it makes.
+    Args:
+        chain: Combine documents chain.
+        docs (List[Document]): Documents given to the chain.
+        llm: LangChain chat model of the chain.
+        rate_limiter (RateLimiter): Shared per-minute limits, or None.
+        calls (int): Number of LLM calls the chain makes (one per document for refine).
+    Returns:
+        str: The chain output.
+    """
+    if rate_limiter:
+        await rate_limiter.aacquire(sum(llm.get_num_tokens(doc.page_content) for doc in docs) + calls * MAP_OUTPUT_TOKENS)
+        for _ in range(calls - 1):
+            await rate_limiter.aacquire()
+    output = await chain.acall({"input_documents": docs}, return_only_outputs=True)
+    return output["output_text"]
+
+
+async def asummary_variations(chain, docs, num_summaries, llm, prompt=None, token_max=None, rate_limiter=None):
+    """
+    Get num_summaries outputs of a combine chain over the same documents.
+    When the documents fit in one prompt they are sent as plain LLM calls (a single request
+    returning every variation if the model supports `n`); otherwise the chain runs
+    num_summaries times concurrently. Every call goes through the rate limiter.
+    Args:
+        chain: Combine documents chain (stuff, refine or the reduce step of map_reduce).
+        docs (List[Document]): Documents given to the chain (map outputs for map_reduce).
+        num_summaries (int): Number of variations.
+        llm: LangChain chat model of the chain.
+        prompt (PromptTemplate): Prompt of a single-call chain (with a {text} variable), None for refine.
+        token_max (int): Largest prompt the chain sends in one call, None for no limit.
+        rate_limiter (RateLimiter): Shared per-minute limits, or None.
+    Returns:
+        List[str]: The summaries.
+    """
+    if prompt is not None:
+        prompt_text = prompt.format(text=DOCUMENT_SEPARATOR.join(doc.page_content for doc in docs))
+        if token_max is None or llm.get_num_tokens(prompt_text) <= token_max:
+            if num_summaries > 1 and supports_n(llm):
+                return await agenerate_n(llm, prompt_text, num_summaries, rate_limiter)
+            return list(await asyncio.gather(
+                *(acall_llm(llm, prompt_text, rate_limiter) for _ in range(num_summaries))
+            ))
+
+    calls = 1 if prompt is not None else len(docs)
+    return list(await asyncio.gather(
+        *(acall_chain(chain, docs, llm, rate_limiter, calls) for _ in range(num_summaries))
+    ))
+
+
+def run_summary_variations(chain, docs, num_summaries, llm, prompt=None, token_max=None, rate_limiter=None):
+    """
+    Synchronous entry point of asummary_variations.
+    """
+    return asyncio.run(asummary_variations(chain, docs, num_summaries, llm, prompt, token_max, rate_limiter))
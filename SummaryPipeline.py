@@ -0,0 +1,214 @@
+import json
+import os
+import re
+from functools import lru_cache
+
+from langchain import PromptTemplate
+from langchain.chains.summarize import load_summarize_chain
+from langchain.docstore.document import Document
+from langchain.document_loaders import PyPDFLoader
+from youtube_transcript_api import (YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound,
+                                    NoTranscriptAvailable, VideoUnavailable)
+from youtube_transcript_api.formatters import TextFormatter
+
+from CacheUtils import atomic_write, cache_dir, evict_lru, hash_parts, touch
+from RateLimiter import RateLimiter
+from SummaryEngine import MapOutputStore, run_map_phase, run_summary_variations, run_tree_reduce
+from TextSplitter import SentenceTokenSplitter
+from TranscriptCache import TranscriptCache
+from WebFetch import fetch_many
+
+# Map phase settings: parallel LLM calls and the per-minute limits of the OpenAI account
+MAP_MAX_CONCURRENCY = int(os.getenv("MAP_MAX_CONCURRENCY", "8"))
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "90000"))
+
+# Split documents cached on disk by content hash, shared by every session
+DOCUMENT_CACHE_MAX_MB = int(os.getenv("DOCUMENT_CACHE_MAX_MB", "512"))
+# Language of the YouTube transcripts
+TRANSCRIPT_LANGUAGE = os.getenv("TRANSCRIPT_LANGUAGE", "en")
+# Errors that mean the video has no transcript (remembered in the negative cache)
+NO_TRANSCRIPT_ERRORS = (TranscriptsDisabled, NoTranscriptFound, NoTranscriptAvailable, VideoUnavailable)
+YOUTUBE_URL_PATTERN = re.compile(r"(?:youtube\.com\/(?:[^\/]+\/.+\/|\S*?[?&]v=)|youtu\.be\/)([a-zA-Z0-9_-]+)")
+
+
+# One rate limiter per process (every session, every batch worker), since the limits are per API key
+@lru_cache(maxsize=None)
+def get_rate_limiter():
+    return RateLimiter(OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE)
+
+
+# Map outputs saved on disk, so changing the custom prompt only reruns the reduce step
+@lru_cache(maxsize=None)
+def get_map_store():
+    return MapOutputStore()
+
+
+# Transcripts saved on disk and shared by every session
+@lru_cache(maxsize=None)
+def get_transcript_cache():
+    return TranscriptCache()
+
+
+def load_cached_documents(document_key):
+    """
+    Read split documents from the disk cache, returns None on a miss.
+    """
+    entry_path = os.path.join(cache_dir("summary_documents"), f"{document_key}.json")
+    try:
+        with open(entry_path, encoding="utf-8") as f:
+            rows = json.load(f)
+    except (OSError, ValueError):
+        return None
+    touch(entry_path)  # mark the entry as recently used
+    return [Document(page_content=row["page_content"], metadata=row["metadata"]) for row in rows]
+
+
+def save_cached_documents(document_key, docs):
+    """
+    Write split documents to the disk cache and evict the least recently used entries.
+    """
+    document_cache = cache_dir("summary_documents")
+    with atomic_write(os.path.join(document_cache, f"{document_key}.json")) as tmp_path, \
+            open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs], f)
+    evict_lru(document_cache, DOCUMENT_CACHE_MAX_MB * 1024 * 1024, keep=(f"{document_key}.json",))
+
+
+def setup_documents(file_hash, pdf_file_path, chunk_size, chunk_overlap):
+    """
+    Load and split a PDF file into smaller chunks for processing (cached on disk by content).
+    Args:
+        file_hash (str): sha256 of the PDF bytes.
+        pdf_file_path (str): Path to the PDF file.
+        chunk_size (int): Size of each text chunk in tokens.
+        chunk_overlap (int): Overlap between chunks in tokens.
+    Returns:
+        List[Document]: List of text chunks as LangChain documents.
+    """
+    document_key = hash_parts(file_hash, "sentence-tokens", chunk_size, chunk_overlap)
+    docs = load_cached_documents(document_key)
+    if docs is not None:
+        return docs
+    loader = PyPDFLoader(pdf_file_path)  # Load the PDF file
+    docs_raw = loader.load()  # Extract raw text from the PDF
+    docs_raw_text = [doc.page_content for doc in docs_raw]  # Extract text content from each page
+    text_splitter = SentenceTokenSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    docs = text_splitter.create_documents(docs_raw_text)  # Split text into chunks at sentence / paragraph ends
+    save_cached_documents(document_key, docs)
+    return docs
+
+
+def split_text_documents(text, chunk_size, chunk_overlap):
+    """
+    Split a blog or transcript text into chunks sized in tokens.
+    """
+    return SentenceTokenSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).create_documents([text])
+
+
+def fetch_blog_content(urls, on_error=None):
+    """
+    Fetch and extract text content from one or more blog URLs.
+    The pages are downloaded concurrently through a pooled, cached HTTP session.
+    Args:
+        urls (str): URLs of the blogs, separated by spaces.
+        on_error (callable): Called with an error message for each page that could not be fetched.
+    Returns:
+        str: Extracted text content of every page that could be fetched.
+    """
+    contents = []
+    for url, content, error in fetch_many(urls.split()):
+        if error is not None:
+            if on_error:
+                on_error(f"Error fetching blog content from {url}: {error}")
+        elif content:
+            contents.append(content)
+    return "\n\n".join(contents) or None
+
+
+def fetch_youtube_transcript(video_url, on_error=None):
+    """
+    Fetch the transcript of a YouTube video using its URL.
+    Args:
+        video_url (str): URL of the YouTube video.
+        on_error (callable): Called with an error message when there is no transcript.
+    Returns:
+        tuple: (formatted_transcript, video_id) or (None, None) if an error occurs.
+    """
+    video_id_match = YOUTUBE_URL_PATTERN.search(video_url)
+    if not video_id_match:
+        if on_error:
+            on_error("Invalid YouTube URL.")
+        return None, None
+
+    video_id = video_id_match.group(1)  # Extract the video ID
+    transcript_cache = get_transcript_cache()
+    cached = transcript_cache.lookup(video_id, TRANSCRIPT_LANGUAGE)
+    if cached is not None:
+        formatted_transcript, error = cached
+        if error is not None:
+            if on_error:
+                on_error(f"Error fetching transcript: {error}")  # The video had no transcript last time
+            return None, None
+        return formatted_transcript, video_id
+    try:
+        transcript = YouTubeTranscriptApi.get_transcript(video_id, languages=[TRANSCRIPT_LANGUAGE])  # Fetch the transcript
+        formatter = TextFormatter()
+        formatted_transcript = formatter.format_transcript(transcript)  # Format the transcript as plain text
+        transcript_cache.store(video_id, TRANSCRIPT_LANGUAGE, transcript=formatted_transcript)
+        return formatted_transcript, video_id
+    except NO_TRANSCRIPT_ERRORS as e:
+        transcript_cache.store(video_id, TRANSCRIPT_LANGUAGE, error=str(e))  # Do not ask again for a while
+        if on_error:
+            on_error(f"Error fetching transcript: {e}")
+        return None, None
+    except Exception as e:
+        if on_error:
+            on_error(f"Error fetching transcript: {e}")
+        return None, None
+
+
+def custom_summary(docs, llm, custom_prompt, chain_type, num_summaries, on_progress=None):
+    """
+    Generate summaries using a custom prompt and selected chain type.
+    With map_reduce the map calls run concurrently within the OpenAI rate limits, and only once
+    for all the summaries; map outputs too long for one prompt are reduced as a tree, level by
+    level. The summaries themselves are generated concurrently (or in one request with the
+    OpenAI `n` parameter when the input fits in a single prompt).
+    Args:
+        docs (List[Document]): List of text chunks to summarize.
+        llm: Language model to use for summarization.
+        custom_prompt (str): Custom prompt for summarization.
+        chain_type (str): Type of summarization chain (map_reduce, stuff, refine).
+        num_summaries (int): Number of summaries to generate.
+        on_progress (callable): Called with (done, total) as the map calls finish, and with
+            (done, total, level) as the tree reduce calls finish.
+    Returns:
+        List[str]: List of generated summaries.
+    """
+    custom_prompt = custom_prompt + """:\n {text}"""  # Append the custom prompt
+    COMBINE_PROMPT = PromptTemplate(template=custom_prompt, input_variables=["text"])
+    MAP_PROMPT = PromptTemplate(template="Summarize:\n{text}", input_variables=["text"])
+    if chain_type == "map_reduce":
+        chain = load_summarize_chain(llm, chain_type=chain_type, map_prompt=MAP_PROMPT, combine_prompt=COMBINE_PROMPT)
+    else:
+        chain = load_summarize_chain(llm, chain_type=chain_type)
+
+    if chain_type == "map_reduce":
+        # Map phase: summarize all the chunks concurrently (reusing stored outputs), once for all the summaries
+        map_outputs = run_map_phase(docs, llm, MAP_PROMPT, MAP_MAX_CONCURRENCY, get_rate_limiter(), on_progress, get_map_store())
+        # Tree reduce: collapse the map outputs in parallel levels until they fit in the combine prompt
+        reduce_chain = chain.reduce_documents_chain
+        reduced = run_tree_reduce(map_outputs, llm, MAP_PROMPT, COMBINE_PROMPT, reduce_chain.token_max,
+                                  MAP_MAX_CONCURRENCY, get_rate_limiter(), on_progress, get_map_store())
+        mapped_docs = [Document(page_content=text) for text in reduced]
+        # Reduce phase: only this step is sampled num_summaries times
+        summaries = run_summary_variations(reduce_chain, mapped_docs, num_summaries, llm, COMBINE_PROMPT,
+                                           reduce_chain.token_max, get_rate_limiter())
+    elif chain_type == "stuff":
+        summaries = run_summary_variations(chain, docs, num_summaries, llm, chain.llm_chain.prompt,
+                                           rate_limiter=get_rate_limiter())
+    else:
+        summaries = run_summary_variations(chain, docs, num_summaries, llm,  # refine chains run side by side
+                                           rate_limiter=get_rate_limiter())
+    return summaries
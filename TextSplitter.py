@@ -0,0 +1,174 @@
+import re
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+import numpy as np
+import tiktoken
+from langchain.docstore.document import Document
+
+# A sentence ends at . ! ? followed by spaces or at a paragraph break; single line breaks are only
+# hard wraps of PDF text, the splitter cuts at them just when a sentence is longer than a chunk
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n[ \t]*\n\s*")
+LINE_BREAK = re.compile(r"\n\s*")
+# Line breaks with an empty line in between end a paragraph
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+WHITESPACE = re.compile(r"\s+")
+# Keeps course codes, equation names and dotted numbers together (e.g. "cs-101", "eq.3", "navier-stokes")
+TOKEN_PATTERN = re.compile(r"\w+(?:[-.]\w+)*")
+
+
+def tokenize(text):
+    """
+    Split a text into lowercase terms (BM25 index, sentence ranking).
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SentenceTokenSplitter:
+    """
+    Split text into chunks sized in tiktoken tokens, cutting at sentence and
+    paragraph boundaries. Chunks are computed as (start, end) offsets into the
+    source text and only turned into strings when asked for.
+    """
+
+    def __init__(self, chunk_size=256, chunk_overlap=32, encoding_name="cl100k_base"):
+        """
+        Args:
+            chunk_size (int): Maximum number of tokens in a chunk.
+            chunk_overlap (int): Tokens repeated from the end of the previous chunk.
+            encoding_name (str): tiktoken encoding (cl100k_base is used by the OpenAI chat and embedding models).
+        """
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.encoding_name = encoding_name
+        self._encoding = None
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            self._encoding = tiktoken.get_encoding(self.encoding_name)
+        return self._encoding
+
+    def _unit_bounds(self, text):
+        """
+        Offsets of the sentence / paragraph units: a unit is [start, end) and its text
+        without the trailing whitespace is [start, content_end).
+        """
+        return self._bounds(text, SENTENCE_BOUNDARY, len(text) - len(text.lstrip()), len(text))  # skip leading whitespace
+
+    @staticmethod
+    def _bounds(text, boundary, position, text_end):
+        """
+        Units of text[position:text_end] cut at the matches of a boundary pattern.
+        """
+        starts, content_ends, ends = [], [], []
+        for match in boundary.finditer(text, position, text_end):
+            if match.start() > position:
+                starts.append(position)
+                content_ends.append(match.start())
+                ends.append(match.end())
+            position = match.end()
+        if position < text_end:
+            starts.append(position)
+            content_ends.append(text_end)
+            ends.append(text_end)
+        return starts, content_ends, ends
+
+    def _count_tokens(self, text, starts, ends):
+        encode = self.encoding.encode_ordinary  # a plain loop, the batch API costs a thread pool task per unit
+        return [len(encode(text[s:e])) for s, e in zip(starts, ends)]
+
+    def _split_long_units(self, text, starts, content_ends, ends, tokens):
+        """
+        Cut units longer than chunk_size at line breaks, or else at whitespace (or anywhere if there is none).
+        """
+        new_starts, new_content_ends, new_ends = [], [], []
+        for start, content_end, end, count in zip(starts, content_ends, ends, tokens):
+            if count <= self.chunk_size:
+                new_starts.append(start)
+                new_content_ends.append(content_end)
+                new_ends.append(end)
+                continue
+            if LINE_BREAK.search(text, start, content_end):
+                line_starts, line_content_ends, line_ends = self._bounds(text, LINE_BREAK, start, content_end)
+                line_ends[-1] = end  # the last line keeps the whitespace after the unit
+                new_starts.extend(line_starts)
+                new_content_ends.extend(line_content_ends)
+                new_ends.extend(line_ends)
+                continue
+            # pieces of about a quarter of a chunk, measured in characters per token of this unit
+            piece_chars = max(1, int((content_end - start) * self.chunk_size / (4 * count)))
+            position = start
+            while position < content_end:
+                cut = min(content_end, position + piece_chars)
+                space = WHITESPACE.search(text, cut, min(content_end, cut + piece_chars)) if cut < content_end else None
+                new_starts.append(position)
+                new_content_ends.append(space.start() if space else cut)
+                position = space.end() if space else cut
+                new_ends.append(position if position < content_end else end)
+        return new_starts, new_content_ends, new_ends
+
+    def split_offsets(self, text):
+        """
+        Compute the chunks of a text.
+        Args:
+            text (str): Source text.
+        Returns:
+            np.ndarray: (n, 2) array of (start, end) character offsets into text.
+        """
+        starts, content_ends, ends = self._unit_bounds(text)
+        if not starts:
+            return np.zeros((0, 2), dtype=np.int64)
+
+        tokens = self._count_tokens(text, starts, ends)  # trailing whitespace included, so sums never undercount
+        while max(tokens) > self.chunk_size:  # a piece may still be too long after one pass
+            unit_count = len(starts)
+            starts, content_ends, ends = self._split_long_units(text, starts, content_ends, ends, tokens)
+            tokens = self._count_tokens(text, starts, ends)
+            if len(starts) == unit_count:
+                break  # single characters longer than chunk_size, nothing left to cut
+
+        cumulative = [0] + list(accumulate(tokens))  # tokens before unit i = cumulative[i]
+        # units followed by an empty line, stored as the chunk end (exclusive unit index) they allow
+        paragraph_ends = [i + 1 for i, (content_end, end) in enumerate(zip(content_ends, ends))
+                          if PARAGRAPH_BREAK.search(text, content_end, end)]
+
+        chunks = []
+        first = 0
+        unit_count = len(starts)
+        while first < unit_count:
+            # last unit that still fits, then prefer a paragraph end in the second half of the window
+            last = max(first + 1, min(bisect_right(cumulative, cumulative[first] + self.chunk_size) - 1, unit_count))
+            if last < unit_count:
+                candidate = bisect_right(paragraph_ends, last) - 1
+                if candidate >= 0 and first < paragraph_ends[candidate] and \
+                        cumulative[paragraph_ends[candidate]] >= cumulative[first] + self.chunk_size // 2:
+                    last = paragraph_ends[candidate]
+            chunks.append((starts[first], content_ends[last - 1]))
+            if last >= unit_count:
+                break
+            # step back over whole units to repeat about chunk_overlap tokens
+            next_first = bisect_left(cumulative, cumulative[last] - self.chunk_overlap)
+            first = max(first + 1, min(next_first, last))
+
+        return np.asarray(chunks, dtype=np.int64)
+
+    def split_text(self, text):
+        """
+        Split a text into chunk strings.
+        """
+        return [text[start:end] for start, end in self.split_offsets(text)]
+
+    def create_documents(self, texts, metadatas=None):
+        """
+        Split texts into LangChain documents (same interface as the LangChain splitters).
+        The offsets of each chunk in its source text are kept in the metadata.
+        """
+        documents = []
+        for i, text in enumerate(texts):
+            metadata = metadatas[i] if metadatas else {}
+            for start, end in self.split_offsets(text):
+                documents.append(Document(page_content=text[start:end], metadata={**metadata, "start": int(start), "end": int(end)}))
+        return documents
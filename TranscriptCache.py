@@ -0,0 +1,73 @@
+import time
+
+from CacheUtils import open_sqlite
+
+
+class TranscriptCache:
+    """
+    Video transcripts shared across sessions, keyed by video id and language.
+    Videos without a transcript are remembered too (for a shorter time), so they
+    are not asked for again on every rerun.
+    """
+
+    def __init__(self, ttl_seconds=30 * 24 * 3600, negative_ttl_seconds=24 * 3600, max_entries=5000, db_path=None):
+        """
+        Args:
+            ttl_seconds (int): Age after which a transcript is fetched again.
+            negative_ttl_seconds (int): Age after which a video without a transcript is tried again.
+            max_entries (int): Number of videos kept, the least recently used are evicted.
+            db_path (str): SQLite file, defaults to the "transcripts" cache.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self._conn, self._lock = open_sqlite(
+            "transcripts",
+            "CREATE TABLE IF NOT EXISTS transcripts (video_id TEXT, language TEXT, transcript TEXT, error TEXT, "
+            "created_at REAL, last_used REAL, PRIMARY KEY (video_id, language))",
+            db_path=db_path,
+        )
+
+    def lookup(self, video_id, language):
+        """
+        Find a cached transcript.
+        Args:
+            video_id (str): YouTube video id.
+            language (str): Language code of the transcript.
+        Returns:
+            tuple or None: (transcript, error) with one of them None, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT transcript, error, created_at FROM transcripts WHERE video_id = ? AND language = ?",
+                (video_id, language),
+            ).fetchone()
+            if row is None:
+                return None
+            transcript, error, created_at = row
+            if now - created_at > (self.ttl_seconds if error is None else self.negative_ttl_seconds):
+                return None  # expired, replaced by the next store
+            self._conn.execute(
+                "UPDATE transcripts SET last_used = ? WHERE video_id = ? AND language = ?", (now, video_id, language)
+            )
+            self._conn.commit()
+        return transcript, error
+
+    def store(self, video_id, language, transcript=None, error=None):
+        """
+        Save a transcript, or the error of a video without one, then evict the least recently used videos.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transcripts (video_id, language, transcript, error, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, language, transcript, error, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM transcripts WHERE rowid IN "
+                "(SELECT rowid FROM transcripts ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
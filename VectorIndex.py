@@ -0,0 +1,165 @@
+import os
+import pickle
+import time
+
+import faiss
+import numpy as np
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.vectorstores import FAISS
+
+# Corpus sizes (number of chunks) where the index type changes: flat -> HNSW -> IVF-PQ
+FLAT_MAX_VECTORS = int(os.getenv("FAISS_FLAT_MAX_VECTORS", "20000"))
+HNSW_MAX_VECTORS = int(os.getenv("FAISS_HNSW_MAX_VECTORS", "200000"))
+
+# HNSW graph settings
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+
+# IVF-PQ settings, training uses a random sample of the vectors
+IVF_NPROBE = 16
+PQ_BITS = 8
+TRAIN_SAMPLE_PER_LIST = 64
+
+
+def choose_index_type(vector_count):
+    """
+    Pick the FAISS index type for a corpus size.
+    Args:
+        vector_count (int): Number of chunks to index.
+    Returns:
+        str: "flat", "hnsw" or "ivfpq".
+    """
+    if vector_count <= FLAT_MAX_VECTORS:
+        return "flat"
+    if vector_count <= HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivfpq"
+
+
+def _pq_subquantizers(dimension):
+    for m in (96, 64, 48, 32, 24, 16, 8, 4):
+        if dimension % m == 0 and dimension // m >= 4:
+            return m
+    return 1
+
+
+def create_index(vectors, index_type=None):
+    """
+    Create an empty (and trained, for IVF-PQ) FAISS index for a set of vectors.
+    Args:
+        vectors (np.ndarray): float32 matrix of shape (n, d), used for training.
+        index_type (str): "flat", "hnsw" or "ivfpq", picked from the corpus size if None.
+    Returns:
+        faiss.Index: Index ready for add().
+    """
+    vector_count, dimension = vectors.shape
+    index_type = index_type or choose_index_type(vector_count)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+
+    if index_type == "ivfpq":
+        nlist = max(1, min(int(4 * np.sqrt(vector_count)), vector_count // 39))  # FAISS wants ~39 points per list
+        quantizer = faiss.IndexFlatL2(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_subquantizers(dimension), PQ_BITS)
+        sample_size = min(vector_count, nlist * TRAIN_SAMPLE_PER_LIST)
+        sample = vectors[np.random.default_rng(0).choice(vector_count, sample_size, replace=False)]
+        index.train(sample)
+        index.nprobe = min(IVF_NPROBE, nlist)
+        return index
+
+    return faiss.IndexFlatL2(dimension)
+
+
+def is_flat_index(index):
+    """
+    Flat indexes can drop vectors in place, the approximate ones are rebuilt instead.
+    """
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlat)
+
+
+def build_vectorstore(texts, vectors, embeddings, metadatas=None, index_type=None):
+    """
+    Build a LangChain FAISS vectorstore on the index type that fits the corpus size.
+    Args:
+        texts (List[str]): Chunk texts.
+        vectors (List[List[float]]): Embedding of each chunk.
+        embeddings (Embeddings): Model used to embed the queries.
+        metadatas (List[dict]): Metadata of each chunk.
+        index_type (str): Force an index type instead of picking it from the size.
+    Returns:
+        FAISS: The vectorstore.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    index = create_index(matrix, index_type)
+    vectorstore = FAISS(embeddings.embed_query, index, InMemoryDocstore(), {})
+    vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+    return vectorstore
+
+
+def load_vectorstore(folder_path, embeddings, mmap=True):
+    """
+    Load a vectorstore saved with FAISS.save_local.
+    With mmap the IVF lists stay in the file and are shared by every session
+    through the page cache; such an index is read only.
+    Args:
+        folder_path (str): Folder given to save_local.
+        embeddings (Embeddings): Model used to embed the queries.
+        mmap (bool): Memory map the index file when FAISS supports it for the index type.
+    Returns:
+        FAISS: The vectorstore.
+    """
+    index_path = os.path.join(folder_path, "index.faiss")
+    index = None
+    if mmap:
+        try:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            index = None  # index type without mmap support
+    if index is None:
+        index = faiss.read_index(index_path)
+    if isinstance(faiss.downcast_index(index), faiss.IndexHNSWFlat):
+        faiss.downcast_index(index).hnsw.efSearch = HNSW_EF_SEARCH  # not stored in the file
+    elif isinstance(faiss.downcast_index(index), faiss.IndexIVF):
+        faiss.downcast_index(index).nprobe = min(IVF_NPROBE, faiss.downcast_index(index).nlist)
+
+    with open(os.path.join(folder_path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings.embed_query, index, docstore, index_to_docstore_id)
+
+
+def recall_report(vectors, queries, k=10, index_types=("hnsw", "ivfpq")):
+    """
+    Compare approximate index types with the exact flat index.
+    Args:
+        vectors (np.ndarray): Corpus vectors, float32 (n, d).
+        queries (np.ndarray): Query vectors, float32 (q, d).
+        k (int): Number of neighbours compared.
+        index_types (tuple): Index types to compare with "flat".
+    Returns:
+        List[dict]: One row per index type with build time, recall@k and mean query latency.
+    """
+    rows = []
+    exact_ids = None
+    for index_type in ("flat",) + tuple(index_types):
+        start = time.perf_counter()
+        index = create_index(vectors, index_type)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for query in queries:  # one query at a time, like a chat session
+            index.search(query[None, :], k)
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        _, ids = index.search(queries, k)
+
+        if exact_ids is None:
+            exact_ids = ids
+        recall = np.mean([len(set(found) & set(exact)) / k for found, exact in zip(ids, exact_ids)])
+        rows.append({"index": index_type, "build_s": round(build_seconds, 3),
+                     "recall_at_k": round(float(recall), 4), "latency_ms": round(latency_ms, 3)})
+    return rows
@@ -0,0 +1,181 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter
+
+from CacheUtils import atomic_write, cache_dir, evict_lru, hash_parts, touch
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"  # several times faster than the pure Python parser
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# (connect, read) timeouts in seconds, so one slow host cannot hang a session
+HTTP_TIMEOUT = (float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")), float(os.getenv("HTTP_READ_TIMEOUT", "20")))
+# Responses bigger than this are refused
+MAX_RESPONSE_BYTES = int(os.getenv("HTTP_MAX_RESPONSE_MB", "10")) * 1024 * 1024
+HTTP_CACHE_MAX_MB = int(os.getenv("HTTP_CACHE_MAX_MB", "256"))
+# Seconds a cached response is served without asking the host, when it sends no Cache-Control max-age
+HTTP_CACHE_DEFAULT_TTL = int(os.getenv("HTTP_CACHE_DEFAULT_TTL", "3600"))
+MAX_AGE = re.compile(r"(?:^|,)\s*max-age\s*=\s*\"?(\d+)", re.IGNORECASE)
+POOL_SIZE = 16
+READ_BLOCK_SIZE = 64 * 1024
+USER_AGENT = "AcademiAI/1.0"
+
+_session = None
+
+
+def get_session():
+    """
+    Shared requests session, so connections to the same hosts are pooled and kept alive.
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["User-Agent"] = USER_AGENT
+        _session = session
+    return _session
+
+
+def _entry_path(url):
+    return os.path.join(cache_dir("http"), f"{hash_parts(url)}.bin")
+
+
+def _load_entry(url):
+    """
+    Cached response of a URL as (metadata dict, body bytes), or (None, None).
+    The entry file is one JSON line of metadata followed by the raw body.
+    """
+    try:
+        with open(_entry_path(url), "rb") as f:
+            metadata = json.loads(f.readline())
+            return metadata, f.read()
+    except (OSError, ValueError):
+        return None, None
+
+
+def _save_entry(url, metadata, body):
+    http_cache = cache_dir("http")
+    with atomic_write(_entry_path(url)) as tmp_path, open(tmp_path, "wb") as f:
+        f.write(json.dumps(metadata).encode("utf-8") + b"\n")
+        f.write(body)
+    evict_lru(http_cache, HTTP_CACHE_MAX_MB * 1024 * 1024, keep=(os.path.basename(_entry_path(url)),))
+
+
+def _read_capped(response):
+    """
+    Read a streamed response body, refusing it once it goes over MAX_RESPONSE_BYTES.
+    """
+    declared = response.headers.get("Content-Length")
+    if declared and declared.isdigit() and int(declared) > MAX_RESPONSE_BYTES:
+        raise ValueError(f"Response too large ({int(declared) // 1024} KB)")
+    chunks, size = [], 0
+    for chunk in response.iter_content(READ_BLOCK_SIZE):
+        size += len(chunk)
+        if size > MAX_RESPONSE_BYTES:
+            raise ValueError(f"Response larger than {MAX_RESPONSE_BYTES // 1024} KB")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def declared_encoding(response):
+    """
+    Charset of the Content-Type header, or None when there is none.
+    (requests falls back to ISO-8859-1 for text/html, which would override a <meta charset> in the page.)
+    """
+    if "charset=" not in response.headers.get("Content-Type", "").lower():
+        return None
+    return requests.utils.get_encoding_from_headers(response.headers)
+
+
+def freshness_lifetime(response):
+    """
+    Seconds a response may be served from the cache without revalidation, or None if it must not be stored.
+    """
+    cache_control = response.headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0
+    max_age = MAX_AGE.search(cache_control)
+    return int(max_age.group(1)) if max_age else HTTP_CACHE_DEFAULT_TTL
+
+
+def fetch_url(url):
+    """
+    GET a URL through the shared session and the on-disk HTTP cache.
+    Fresh cached responses (Cache-Control max-age, or HTTP_CACHE_DEFAULT_TTL) are served without
+    a request; stale ones are revalidated with ETag / Last-Modified, so an unchanged page costs a 304.
+    Args:
+        url (str): Page to fetch.
+    Returns:
+        Tuple[bytes, str]: (body, encoding declared by the server or None).
+    """
+    metadata, body = _load_entry(url)
+    if metadata and metadata.get("fresh_until", 0) > time.time():
+        touch(_entry_path(url))  # mark the entry as recently used
+        return body, metadata.get("declared_encoding")
+    headers = {}
+    if metadata:
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+
+    try:
+        with get_session().get(url, headers=headers, timeout=HTTP_TIMEOUT, stream=True) as response:
+            lifetime = freshness_lifetime(response)
+            if response.status_code == 304 and metadata:
+                if lifetime is not None:
+                    _save_entry(url, {**metadata, "fresh_until": time.time() + lifetime}, body)  # fresh again
+                return body, metadata.get("declared_encoding")
+            response.raise_for_status()
+            body = _read_capped(response)
+            encoding = declared_encoding(response)
+            etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+    except requests.ConnectionError:
+        if metadata:
+            return body, metadata.get("declared_encoding")  # host unreachable, serve the cached copy
+        raise
+
+    if lifetime is not None:
+        _save_entry(url, {"url": url, "etag": etag, "last_modified": last_modified, "declared_encoding": encoding,
+                          "fresh_until": time.time() + lifetime}, body)
+    return body, encoding
+
+
+def extract_paragraphs(html, encoding=None):
+    """
+    Text of the <p> tags of an HTML page (only those tags are built into the tree).
+    """
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=SoupStrainer("p"), from_encoding=encoding)
+    return "\n".join(text for text in (p.get_text() for p in soup.find_all("p")) if text)
+
+
+def fetch_many(urls, max_workers=8):
+    """
+    Fetch several pages concurrently.
+    Args:
+        urls (List[str]): Pages to fetch.
+        max_workers (int): Number of downloads at once.
+    Returns:
+        List[Tuple[str, str, Exception]]: (url, paragraph text, error) for each URL in order,
+        with either the text or the error set to None.
+    """
+    def fetch_one(url):
+        try:
+            return url, extract_paragraphs(*fetch_url(url)), None
+        except (requests.RequestException, ValueError) as e:
+            return url, None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls)))) as executor:
+        return list(executor.map(fetch_one, urls))
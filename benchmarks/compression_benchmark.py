@@ -0,0 +1,117 @@
+"""
+Tokens saved by the extractive pre-compression, against simple summary quality proxies.
+
+Proxies (no LLM calls):
+    keyword recall   share of the top TF-IDF terms of the full text still present
+    centroid cosine  cosine similarity of the term vectors of the full and compressed texts
+    reference recall ROUGE-1 recall of a reference summary (--reference) in the compressed text
+
+Usage:
+    python benchmarks/compression_benchmark.py --pages 300
+    python benchmarks/compression_benchmark.py --pdfs paper1.pdf paper2.pdf --reference summary.txt --ratios 0.3 0.5
+"""
+import argparse
+import os
+import random
+import sys
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ExtractiveCompressor import STOP_WORDS, ExtractiveCompressor  # noqa: E402
+from TextSplitter import SentenceTokenSplitter, tokenize  # noqa: E402
+
+TOPICS = [("gradient", "descent", "convergence", "learning", "rate"), ("protein", "folding", "structure", "energy"),
+          ("graph", "neural", "network", "message", "passing"), ("climate", "model", "temperature", "forecast")]
+FILLER = "the as shown in this section we also note that it is worth mentioning that in addition furthermore".split()
+
+
+def synthetic_paper(pages, seed=0):
+    """
+    Pages of a fake paper: topic sentences mixed with filler, a running header and footer,
+    and references plus acknowledgements at the end.
+    """
+    rng = random.Random(seed)
+    texts = []
+    for page in range(pages):
+        topic = TOPICS[(page * len(TOPICS)) // pages]
+        sentences = []
+        for _ in range(rng.randint(12, 20)):
+            words = rng.choices(topic, k=rng.randint(2, 6)) + rng.choices(FILLER, k=rng.randint(6, 16))
+            rng.shuffle(words)
+            sentences.append(" ".join(words).capitalize() + ".")
+        texts.append(f"Proceedings of the Synthetic Conference 2024\n{' '.join(sentences)}\n{page + 1}")
+    references = "\n".join(f"[{i}] Author {i}. A study of {' '.join(rng.choice(TOPICS))}. Journal, 20{i % 24:02d}."
+                           for i in range(1, 80))
+    texts.append(f"Acknowledgements\nWe thank the reviewers and our funding agencies.\nReferences\n{references}")
+    return texts
+
+
+def read_pdfs(paths):
+    from PdfUtils import iter_pdf_pages
+    pdfs = [(path, open(path, "rb").read()) for path in paths]
+    return [text for _, _, text in iter_pdf_pages(pdfs)]
+
+
+def term_counts(text):
+    return Counter(term for term in tokenize(text) if len(term) > 1 and term not in STOP_WORDS)
+
+
+def cosine(a, b):
+    dot = sum(count * b.get(term, 0) for term, count in a.items())
+    norm = np.sqrt(sum(c * c for c in a.values())) * np.sqrt(sum(c * c for c in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def top_terms(docs, count=50):
+    """
+    Terms with the highest TF-IDF over the chunks, the "what is this about" words.
+    """
+    per_doc = [term_counts(doc.page_content) for doc in docs]
+    document_frequency = Counter(term for counts in per_doc for term in counts)
+    totals = Counter()
+    for counts in per_doc:
+        totals.update(counts)
+    scores = {term: totals[term] * np.log((len(docs) + 1) / (document_frequency[term] + 1)) for term in totals}
+    return [term for term, _ in sorted(scores.items(), key=lambda item: -item[1])[:count]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="pages of the synthetic paper")
+    parser.add_argument("--pdfs", nargs="*", help="PDF files to use instead of the synthetic paper")
+    parser.add_argument("--reference", help="text file with a reference summary of the input")
+    parser.add_argument("--ratios", type=float, nargs="+", default=[0.3, 0.5, 0.7], help="shares of tokens to keep")
+    parser.add_argument("--chunk-size", type=int, default=500, help="chunk size in tokens (Summary page default)")
+    parser.add_argument("--chunk-overlap", type=int, default=50, help="chunk overlap in tokens")
+    args = parser.parse_args()
+
+    pages = read_pdfs(args.pdfs) if args.pdfs else synthetic_paper(args.pages)
+    docs = SentenceTokenSplitter(args.chunk_size, args.chunk_overlap).create_documents(pages)
+    full_text = " ".join(doc.page_content for doc in docs)
+    full_counts = term_counts(full_text)
+    keywords = top_terms(docs)
+    reference = term_counts(open(args.reference, encoding="utf-8").read()) if args.reference else None
+
+    print(f"{len(pages)} pages, {len(docs)} chunks")
+    header = f"{'ratio':>6} {'tokens':>9} {'saved':>7} {'chunks':>7} {'time_s':>7} {'keywords':>9} {'centroid':>9}"
+    print(header + (f" {'reference':>10}" if reference else ""))
+    for ratio in [1.0] + list(args.ratios):
+        compressor = ExtractiveCompressor(ratio=ratio, drop_boilerplate=ratio < 1.0,
+                                          chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+        compressed, stats = compressor.compress_documents(docs)
+        text = " ".join(doc.page_content for doc in compressed)
+        counts = term_counts(text)
+        chunks = len(compressed)  # map calls left, the compressor packs the sentences like the page and batch runs
+        saved = 1 - stats["tokens_after"] / stats["tokens_before"]
+        row = (f"{ratio:>6.2f} {stats['tokens_after']:>9} {saved:>7.1%} {chunks:>7} {stats['seconds']:>7.2f} "
+               f"{sum(term in counts for term in keywords) / len(keywords):>9.2f} {cosine(full_counts, counts):>9.3f}")
+        if reference:
+            recall = sum(min(count, counts.get(term, 0)) for term, count in reference.items()) / sum(reference.values())
+            row += f" {recall:>10.3f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
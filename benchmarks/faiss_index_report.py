@@ -0,0 +1,57 @@
+"""
+Recall / latency report of the approximate FAISS index types against the flat baseline.
+
+Usage:
+    python benchmarks/faiss_index_report.py --vectors 50000 --dim 1536
+    python benchmarks/faiss_index_report.py --index-dir .cache/faiss_indexes/<key>
+"""
+import argparse
+import os
+import sys
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VectorIndex import recall_report  # noqa: E402
+
+
+def synthetic_vectors(count, dimension, seed=0):
+    """
+    Clustered unit vectors, closer to real embeddings than uniform noise.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, count // 200), dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.3 * rng.standard_normal((count, dimension)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50000, help="number of synthetic corpus vectors")
+    parser.add_argument("--dim", type=int, default=1536, help="dimension of the synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="number of queries")
+    parser.add_argument("--k", type=int, default=10, help="neighbours compared for recall@k")
+    parser.add_argument("--index-dir", help="use the vectors of a flat index saved by the chat page instead")
+    args = parser.parse_args()
+
+    if args.index_dir:
+        index = faiss.read_index(os.path.join(args.index_dir, "index.faiss"))
+        vectors = index.reconstruct_n(0, index.ntotal)
+    else:
+        vectors = synthetic_vectors(args.vectors, args.dim)
+
+    # queries are perturbed corpus vectors, like questions close to a passage
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)].copy()
+    queries += 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, {len(queries)} queries, k={args.k}")
+    print(f"{'index':<8}{'build (s)':>12}{'recall@k':>12}{'latency (ms)':>15}")
+    for row in recall_report(vectors, queries, k=args.k):
+        print(f"{row['index']:<8}{row['build_s']:>12}{row['recall_at_k']:>12}{row['latency_ms']:>15}")
+
+
+if __name__ == "__main__":
+    main()
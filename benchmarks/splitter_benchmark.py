@@ -0,0 +1,74 @@
+"""
+Throughput of the shared token splitter on a large text.
+
+Usage:
+    python benchmarks/splitter_benchmark.py --mb 120
+    python benchmarks/splitter_benchmark.py --files book1.txt book2.txt --compare
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from TextSplitter import SentenceTokenSplitter  # noqa: E402
+
+WORDS = ("the model equation theorem data analysis results method students learning section figure "
+         "table proof energy system network course reading chapter argument evidence").split()
+
+
+def synthetic_text(megabytes, seed=0):
+    """
+    Paragraphs of random sentences, about the given size in MB.
+    """
+    rng = random.Random(seed)
+    paragraphs, size = [], 0
+    while size < megabytes * 1024 * 1024:
+        sentences = [" ".join(rng.choices(WORDS, k=rng.randint(6, 30))).capitalize() + "." for _ in range(rng.randint(2, 8))]
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=100, help="size of the synthetic text in MB")
+    parser.add_argument("--files", nargs="*", help="text files to split instead of synthetic text")
+    parser.add_argument("--chunk-size", type=int, default=256, help="chunk size in tokens")
+    parser.add_argument("--chunk-overlap", type=int, default=32, help="chunk overlap in tokens")
+    parser.add_argument("--compare", action="store_true", help="also time RecursiveCharacterTextSplitter on 10 MB")
+    args = parser.parse_args()
+
+    if args.files:
+        text = "\n\n".join(open(path, encoding="utf-8", errors="ignore").read() for path in args.files)
+    else:
+        text = synthetic_text(args.mb)
+    megabytes = len(text.encode("utf-8")) / (1024 * 1024)
+
+    splitter = SentenceTokenSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    splitter.encoding  # load the encoding outside the timing
+    start = time.perf_counter()
+    offsets = splitter.split_offsets(text)
+    seconds = time.perf_counter() - start
+    sample = [text[s:e] for s, e in offsets[:: max(1, len(offsets) // 2000)]]
+    sizes = [len(tokens) for tokens in splitter.encoding.encode_ordinary_batch(sample)]
+    print(f"SentenceTokenSplitter: {megabytes:.1f} MB in {seconds:.2f} s ({megabytes / seconds:.1f} MB/s), "
+          f"{len(offsets)} chunks, sampled chunk size {sum(sizes) / len(sizes):.0f} tokens (max {max(sizes)})")
+
+    if args.compare:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        part = text[:10 * 1024 * 1024]
+        chars = args.chunk_size * 4  # about 4 characters per token in English
+        start = time.perf_counter()
+        chunks = RecursiveCharacterTextSplitter(chunk_size=chars, chunk_overlap=args.chunk_overlap * 4).split_text(part)
+        seconds = time.perf_counter() - start
+        sizes = [len(tokens) for tokens in splitter.encoding.encode_ordinary_batch(chunks[:: max(1, len(chunks) // 2000)])]
+        print(f"RecursiveCharacterTextSplitter ({chars} chars): {len(part) / (1024 * 1024):.1f} MB in {seconds:.2f} s "
+              f"({len(part) / (1024 * 1024) / seconds:.1f} MB/s), {len(chunks)} chunks, "
+              f"token sizes from {min(sizes)} to {max(sizes)}")
+
+
+if __name__ == "__main__":
+    main()
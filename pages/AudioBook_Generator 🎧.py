@@ -1,16 +1,13 @@
 import openai
 import streamlit as st
 from tempfile import NamedTemporaryFile
-from gtts import gTTS
-import pdfplumber
 import os
 from dotenv import load_dotenv, find_dotenv
 import time
-from PIL import Image
-from io import BytesIO
-import requests
 import replicate
-import time
+from AudioUtils import SpeechCache, text_to_speech_file
+from CoverArt import cached_cover_art, generate_cover_art
+from PdfUtils import load_pdf_texts
 
 # Load environment variables from the .env file
 load_dotenv(find_dotenv())
@@ -18,44 +15,20 @@ load_dotenv(find_dotenv())
 # Retrieve the OpenAI API key from environment variables
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-# Extracting the text from a PDF file
-def extract_text_from_pdf(uploaded_file):
-    # Use BytesIO to treat the uploaded file as a file-like object
-    pdf_content = BytesIO(uploaded_file.read())  # Reading file bytes into memory
-    with pdfplumber.open(pdf_content) as pdf:
-        text = ''
-        for page in pdf.pages:
-            text += page.extract_text()
-    return text
-
-# Convert the PDFs text into speech
-def text_to_speech(text, output_path):
-    time.sleep(10)
-    tts = gTTS(text=text, lang='en')
-    tts.save(output_path)
-
-# Function to generate cover art based on the podcast's topic
-def generate_cover_art(cover_art_title):
-    # Use DALL·E to generate an image based on the podcast title or description
-    prompt = f""" Create an artistic podcast cover for a podcast titled '{cover_art_title}'.
-            It should reflect the topics discussed in the research paper,
-            include things realted to podcasts in the image like Microphone, speaker, Headphones and studio please,
-            NOTE that you dont have to include them all just include what is better for the design, ALSO Include no
-            Text in the cover image"""
-
-    # Generate the image using OpenAI's DALL·E model
-    response = openai.Image.create(
-        prompt=prompt,
-        n=1,
-        size="1024x1024"  # You can adjust the image size
-    )
-    
-    # Get the URL of the generated image
-    image_url = response['data'][0]['url']
-    
-    # Fetch and load the image
-    image = Image.open(BytesIO(requests.get(image_url).content))
-    return image
+# Extracting the text from the PDF files, cached by file content so reruns do not parse them again
+def extract_text_from_pdf(uploaded_files):
+    pdfs = [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+    # pdfplumber pages parsed in parallel processes, pages without text count as empty
+    return ["\n".join(pages) for pages in load_pdf_texts(pdfs, engine="pdfplumber")]
+
+# Sentence audio saved on disk and shared by every session
+@st.cache_resource
+def get_speech_cache():
+    return SpeechCache()
+
+# Convert the PDFs text into speech, in segments synthesized in parallel and joined into one MP3
+def text_to_speech(text, output_path, on_progress=None, on_part=None):
+    return text_to_speech_file(text, output_path, lang='en', on_progress=on_progress, on_part=on_part, cache=get_speech_cache())
 
 # CSS code
 custom_css = """
@@ -158,12 +131,8 @@ st.markdown('''
 # File upload: Allow user to upload multiple PDF files
 uploaded_files = st.file_uploader("Upload PDF files", type="pdf", accept_multiple_files=True)
 if uploaded_files:
-    papers_text = []
-
     # Extract text from each uploaded PDF
-    for uploaded_file in uploaded_files:
-        text = extract_text_from_pdf(uploaded_file)  # Pass the uploaded file directly
-        papers_text.append(text)  # Collect the extracted text from all papers
+    papers_text = extract_text_from_pdf(uploaded_files)  # Collect the extracted text from all papers
 
     cover_art_title = st.text_input("Enter the paper title please ")  # You can change this dynamically
 
@@ -178,9 +147,9 @@ if uploaded_files:
         with col1:
             if st.button("Generate cover Art Image", use_container_width=True):
                 with st.spinner("Generating Cover Art"):
-                    cover_art_image = generate_cover_art(cover_art_title)
+                    cover_art_path, _ = generate_cover_art(cover_art_title)  # Reused if this title was already generated
                     # Display the generated cover art
-                    st.image(cover_art_image, caption="Podcast Cover Art", use_column_width=True)
+                    st.image(cover_art_path, caption="Podcast Cover Art", use_column_width=True)
                     # Display success message
                     st.success("Cover Art generated successfully!")
 
@@ -192,18 +161,31 @@ if uploaded_files:
 
         if st.button("Generate Audio-Book", use_container_width=True):
             with st.spinner("Generating Audio-Book"):
-                    cover_art_image = generate_cover_art(cover_art_title)
+                    # Show the cover if it was generated already (the audio does not wait for a new one)
+                    cover_art = cached_cover_art(cover_art_title) if cover_art_title else None
+                    if cover_art:
+                        st.image(cover_art[1], caption="Podcast Cover Art")
                     # Convert the dialogue script into speech
                     output_audio_path = "generated_podcast.mp3"
                     if papers_text:
                         combined_text = "\n".join(papers_text)  # Join the list of text into one string
-                        text_to_speech(combined_text, output_audio_path)
-
-                    # Provide download link for the generated podcast
+                        progress_bar = st.progress(0.0, text="Synthesizing the audio...")
+                        parts_container = st.container()  # Parts are playable while the rest is synthesized
+                        def show_progress(done, total):
+                            progress_bar.progress(done / total, text=f"Synthesized {done} of {total} segments")
+                        def show_part(number, audio):
+                            with parts_container:
+                                st.caption(f"Part {number}")
+                                st.audio(audio, format='audio/mp3')
+                        text_to_speech(combined_text, output_audio_path, show_progress, show_part)
+                        progress_bar.empty()
+                        cache_stats = get_speech_cache().stats()
+                        st.caption(f"Speech cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)")
+
+                    # Provide download link for the whole generated podcast
                     with open(output_audio_path, "rb") as audio_file:
                         st.success("Audio-Book generated successfully!")
-                        st.audio(audio_file.read(), format='audio/mp3')
-                        st.download_button("Download The Generated Audio-Book", audio_file, file_name=output_audio_path, use_container_width = True)
+                        st.download_button("Download The Generated Audio-Book", audio_file.read(), file_name=output_audio_path, use_container_width = True)
 
   
     else:
@@ -1,72 +1,305 @@
 import os
 import streamlit as st
 from dotenv import load_dotenv, find_dotenv # to import the API keys 
-from PyPDF2 import PdfReader 
-from langchain.text_splitter import CharacterTextSplitter
+from TextSplitter import SentenceTokenSplitter
 from langchain.embeddings import OpenAIEmbeddings, HuggingFaceInstructEmbeddings
-from langchain.vectorstores import FAISS
 from langchain.memory import ConversationBufferMemory
 from langchain.chains import ConversationalRetrievalChain
 from langchain.chat_models import ChatOpenAI
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import HumanMessage, AIMessage
 from HtmlTemplates import user_template, bot_template, css
 from langchain.llms import huggingface_hub
 from gtts import gTTS
 import time
-
-# function to extract text from PDFs
-def get_pdf_text(user_pdfs):
-    text = "" # variable to store all the text from all the PDFs
-
-    for pdf in user_pdfs: # loop through all the PDFs the user entered
-        pdf_reader = PdfReader(pdf) # create a PDF object that have pages 
-        for page in pdf_reader.pages: # loop throough the pages 
-            text += page.extract_text() # append all the text in each page to text variable 
-    return text 
-
-
-# function to turn the entire extracted text into chunks 
-def get_text_chunks(text):
-    text_splitter = CharacterTextSplitter(
-        separator="\n", # set the seperator as a single line 
-        chunk_size=1000, # chunck after a 1000 character 
-        chunk_overlap=200,
-        length_function=len)
-    
-    # split all the text into chunks and store it in chunks variable
-    chunks = text_splitter.split_text(text)
-    return chunks
-
-
-# function to convert the text chunks into vectors 
-def get_vectorstore(text_chunks):
-    embeddings = OpenAIEmbeddings()
+import json
+from CacheUtils import atomic_write, cache_dir, hash_parts, touch, evict_lru
+from EmbeddingCache import CachedEmbeddings
+from PdfUtils import iter_pdf_pages
+from ChatMemory import TokenBudgetMemory
+from HybridRetriever import BM25Index, HybridRetriever
+from VectorIndex import build_vectorstore, load_vectorstore, is_flat_index
+from AnswerCache import AnswerCache, is_standalone_question
+
+# Settings used to split the PDF text (in tokens), they are also part of the FAISS cache key
+CHUNK_SIZE = 256
+CHUNK_OVERLAP = 32
+
+# On-disk FAISS index cache shared by every session (size budget in MB, LRU eviction)
+INDEX_CACHE_MAX_MB = int(os.getenv("INDEX_CACHE_MAX_MB", "2048"))
+
+# Chunk embeddings are stored locally, only new chunks are sent to OpenAI (batch size / parallel requests)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "4"))
+
+# Token budget memory: tokens kept for the chat history and number of recent turns kept word for word
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "2000"))
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "4"))
+
+# Answers reused across sessions for near-identical questions on the same PDFs
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_HOURS = float(os.getenv("ANSWER_CACHE_TTL_HOURS", "168"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+
+# function to extract text from PDFs, pages are parsed in parallel and yielded in order
+def get_pdf_pages(user_pdfs):
+    pdfs = [(file_hash, pdf.getvalue()) for file_hash, pdf in user_pdfs.items()] # (file hash, raw bytes) of the PDFs to index
+    return iter_pdf_pages(pdfs) # generator of (file hash, page number, page text)
+
+
+# function to turn the extracted pages into chunks, each chunk remembers its file and page number
+def get_text_chunks(pages, file_names):
+    text_splitter = SentenceTokenSplitter(
+        chunk_size=CHUNK_SIZE, # chunk after 256 tokens, cut at sentence / paragraph ends
+        chunk_overlap=CHUNK_OVERLAP)
+
+    chunks, metadatas, page_texts = [], [], {}
+    for file_hash, page_number, page_text in pages: # chunking starts while later pages are still being parsed
+        page_texts.setdefault(file_hash, []).append(page_text)
+        for start, end in text_splitter.split_offsets(page_text):
+            chunks.append(page_text[start:end])
+            metadatas.append({"source": file_names[file_hash], "file_hash": file_hash, "page": page_number,
+                              "start": int(start), "end": int(end)}) # position of the chunk in the page text
+
+    # text of each file, joined once instead of growing a string page by page
+    file_texts = {file_hash: {"name": file_names[file_hash], "text": "\n".join(texts)} for file_hash, texts in page_texts.items()}
+    return chunks, metadatas, file_texts
+
+
+# function to get the embeddings model, wrapped with the local chunk embedding cache (one per process)
+@st.cache_resource
+def get_embeddings():
+    return CachedEmbeddings(OpenAIEmbeddings(), batch_size=EMBED_BATCH_SIZE, max_workers=EMBED_MAX_WORKERS)
+
+
+# function to convert the text chunks into vectors, added to an existing vectorstore if one is given
+def get_vectorstore(text_chunks, embeddings=None, metadatas=None, vectorstore=None):
+    if embeddings is None:
+        embeddings = get_embeddings()
 
     # embeddings = HuggingFaceInstructEmbeddings(model_name ="hkunlp/instructor-xl") another model to use 
-    vectorstore = FAISS.from_texts(texts=text_chunks, embedding=embeddings)
+    vectors = embeddings.embed_documents(text_chunks) # one batched call instead of one call per chunk
+    if vectorstore is None:
+        # flat, HNSW or IVF-PQ index depending on the number of chunks
+        return build_vectorstore(text_chunks, vectors, embeddings, metadatas)
+    vectorstore.add_embeddings(list(zip(text_chunks, vectors)), metadatas=metadatas)
     return vectorstore
 
 
-
-def get_conversation_chain(vectorstore):
-    llm = ChatOpenAI()
+# function to group the docstore ids of the vectorstore by the file they come from
+def get_file_chunk_ids(vectorstore):
+    file_chunk_ids = {}
+    for doc_id in vectorstore.index_to_docstore_id.values():
+        file_hash = vectorstore.docstore.search(doc_id).metadata.get("file_hash")
+        file_chunk_ids.setdefault(file_hash, []).append(doc_id)
+    return file_chunk_ids
+
+
+# function to build the cache key of a set of PDFs: same bytes + same splitter + same model -> same index
+def get_index_key(file_hashes, embeddings):
+    return hash_parts(*sorted(file_hashes), "sentence-tokens", CHUNK_SIZE, CHUNK_OVERLAP, embeddings.model)
+
+
+# function to load a saved FAISS index (with the PDF texts and the BM25 index) from the disk cache, returns (None, None, None) on a miss
+def load_cached_vectorstore(index_key, embeddings):
+    entry_path = os.path.join(cache_dir("faiss_indexes"), index_key)
+    if not os.path.isdir(entry_path):
+        return None, None, None
+    try:
+        vectorstore = load_vectorstore(entry_path, embeddings) # memory mapped, shared by the sessions using it
+        with open(os.path.join(entry_path, "texts.json"), encoding="utf-8") as f:
+            file_texts = json.load(f)
+    except Exception:
+        return None, None, None # broken entry, rebuild it
+    try:
+        bm25 = BM25Index.load(entry_path) # saved arrays, the chunks are not tokenized again
+    except (OSError, ValueError, KeyError):
+        bm25 = BM25Index.from_vectorstore(vectorstore) # entry saved before the BM25 index was
+    touch(entry_path) # mark the entry as recently used
+    return vectorstore, file_texts, bm25
+
+
+# function to save a FAISS index (with the PDF texts and the BM25 index) in the disk cache and evict the least recently used indexes
+def save_cached_vectorstore(index_key, vectorstore, file_texts, bm25):
+    index_cache = cache_dir("faiss_indexes")
+    entry_path = os.path.join(index_cache, index_key)
+    if os.path.isdir(entry_path):
+        return
+    try:
+        with atomic_write(entry_path) as tmp_path: # write aside first so readers never see half an index
+            vectorstore.save_local(tmp_path)
+            with open(os.path.join(tmp_path, "texts.json"), "w", encoding="utf-8") as f:
+                json.dump(file_texts, f)
+            bm25.save(tmp_path)
+    except OSError:
+        if not os.path.isdir(entry_path):
+            raise
+        # another session saved the same index first
+    evict_lru(index_cache, INDEX_CACHE_MAX_MB * 1024 * 1024, keep=(index_key,))
+
+
+# function to bring the session vectorstore in line with the uploaded PDFs
+# only new files are embedded and removed files are deleted by id, the rest of the index is kept as is
+def sync_vectorstore(user_pdfs, embeddings):
+    uploads = {hash_parts(pdf.getvalue()): pdf for pdf in user_pdfs} # the same file uploaded twice is indexed once
+    index_key = get_index_key(uploads, embeddings)
+
+    # reuse the index if the same set of PDFs was already processed
+    vectorstore, file_texts, bm25 = load_cached_vectorstore(index_key, embeddings)
+    if vectorstore is not None:
+        return vectorstore, file_texts, index_key, bm25
+
+    vectorstore = st.session_state.vectorstore
+    file_texts = dict(st.session_state.file_texts)
+
+    # chunk only the files that are not indexed yet
+    removed = [file_hash for file_hash in file_texts if file_hash not in uploads]
+    new_pdfs = {file_hash: pdf for file_hash, pdf in uploads.items() if file_hash not in file_texts}
+    text_chunks, chunk_metadatas = [], []
+    if new_pdfs:
+        file_names = {file_hash: pdf.name for file_hash, pdf in new_pdfs.items()}
+        text_chunks, chunk_metadatas, new_texts = get_text_chunks(get_pdf_pages(new_pdfs), file_names)
+        file_texts.update(new_texts)
+
+    if vectorstore is not None and not is_flat_index(vectorstore.index) and (removed or text_chunks):
+        # HNSW / IVF-PQ indexes can't drop vectors in place (and may be memory mapped read only),
+        # so they are rebuilt from the kept chunks, whose vectors come from the embedding cache
+        kept_docs = [vectorstore.docstore.search(doc_id) for doc_id in vectorstore.index_to_docstore_id.values()]
+        kept_docs = [doc for doc in kept_docs if doc.metadata.get("file_hash") not in removed]
+        text_chunks = [doc.page_content for doc in kept_docs] + text_chunks
+        chunk_metadatas = [doc.metadata for doc in kept_docs] + chunk_metadatas
+        vectorstore = None
+    elif vectorstore is not None and removed:
+        # delete the chunks of the files that are no longer uploaded
+        file_chunk_ids = get_file_chunk_ids(vectorstore)
+        removed_ids = [doc_id for file_hash in removed for doc_id in file_chunk_ids.get(file_hash, [])]
+        if removed_ids:
+            vectorstore.delete(removed_ids)
+    for file_hash in removed:
+        file_texts.pop(file_hash)
+
+    # embed and add the new chunks
+    if text_chunks:
+        vectorstore = get_vectorstore(text_chunks, embeddings, chunk_metadatas, vectorstore)
+
+    # build the BM25 index at ingest and save both for the next time these PDFs are uploaded
+    bm25 = None
+    if vectorstore is not None:
+        bm25 = BM25Index.from_vectorstore(vectorstore)
+        save_cached_vectorstore(index_key, vectorstore, file_texts, bm25)
+    return vectorstore, file_texts, index_key, bm25
+
+
+
+# function to create the chat memory, either the full history or a token budget with a running summary
+def get_memory(memory_mode):
+    if memory_mode == "Token budget":
+        return TokenBudgetMemory(
+            llm=ChatOpenAI(temperature=0), # used to update the summary of the older turns
+            max_token_limit=MEMORY_TOKEN_BUDGET,
+            max_turns=MEMORY_RECENT_TURNS,
+            memory_key='chat_history',
+            return_messages=True)
+    return ConversationBufferMemory(memory_key='chat_history', return_messages=True)
+
+
+# function to create the retriever, hybrid mode adds the BM25 index of the same chunks (built if not given)
+def get_retriever(vectorstore, retriever_mode, bm25=None):
+    if retriever_mode == "Hybrid (BM25 + vector)":
+        return HybridRetriever(vectorstore=vectorstore, bm25=bm25 or BM25Index.from_vectorstore(vectorstore))
+    return vectorstore.as_retriever()
+
+
+def get_conversation_chain(vectorstore, memory=None, memory_mode="Token budget", retriever_mode="Hybrid (BM25 + vector)", bm25=None):
+    llm = ChatOpenAI(streaming=True) # answer tokens are sent to the callbacks as they arrive
     #llm = huggingface_hub(repo_id="google/flan-t5-xxl", model_kwargs={"temperature":0.5, "max_length":512})
 
-    memory = ConversationBufferMemory(memory_key='chat_history', return_messages=True)
+    if memory is None:
+        memory = get_memory(memory_mode)
     conversation_chain = ConversationalRetrievalChain.from_llm(
         llm = llm,
-        retriever = vectorstore.as_retriever(),
-        memory = memory
+        retriever = get_retriever(vectorstore, retriever_mode, bm25),
+        memory = memory,
+        condense_question_llm = ChatOpenAI() # not streamed, so only the answer shows up in the bot bubble
     )
 
     return conversation_chain
 
 
-def handle_user_question(user_question):   
+# callback handler that pushes the answer tokens into the bot bubble as they arrive
+class StreamHandler(BaseCallbackHandler):
+    def __init__(self, container):
+        self.container = container # st.empty() placeholder of the bot bubble
+        self.text = ""
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.text += token
+        self.container.write(bot_template.replace("{{MSG}}", self.text), unsafe_allow_html=True)
+
+
+# answer cache shared by every session of the app
+@st.cache_resource
+def get_answer_cache():
+    return AnswerCache(
+        threshold=ANSWER_CACHE_THRESHOLD,
+        ttl_seconds=ANSWER_CACHE_TTL_HOURS * 3600,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES)
+
+
+# function to answer a question, a stored answer is reused when the question does not depend on the chat history
+def ask_question(user_question, callbacks=None, use_answer_cache=True):
+    question_vector = None
+    if use_answer_cache and is_standalone_question(user_question, st.session_state.chat_history):
+        question_vector = get_embeddings().embed_query(user_question)
+        answer = get_answer_cache().lookup(st.session_state.index_key, question_vector)
+        if answer is not None:
+            # keep the turn in the chain memory so follow-up questions still have it
+            st.session_state.conversation.memory.save_context({'question': user_question}, {'answer': answer})
+            return answer
+
     # Pass the user's question to the conversational AI model (stored in session state)
-    response = st.session_state.conversation({'question': user_question})
+    response = st.session_state.conversation({'question': user_question}, callbacks=callbacks)
+    if question_vector is not None:
+        get_answer_cache().store(st.session_state.index_key, user_question, question_vector, response['answer'])
+    return response['answer']
+
+
+# function to add a turn to the displayed chat history
+# (kept apart from the chain memory, which may only hold a summary of the older turns)
+def add_chat_turn(user_question, answer):
+    st.session_state.chat_history = (st.session_state.chat_history or []) + [
+        HumanMessage(content=user_question), AIMessage(content=answer)]
+
+
+# function to display a list of chat messages in one write (user messages at even indexes)
+def render_chat_history(messages):
+    html = "".join(
+        (user_template if i % 2 == 0 else bot_template).replace("{{MSG}}", message.content)
+        for i, message in enumerate(messages)
+    )
+    if html:
+        st.write(html, unsafe_allow_html=True)
+
+
+# streaming mode: the previous turns are shown right away and the answer is written token by token
+def handle_user_question_streaming(user_question, use_answer_cache=True):
+    render_chat_history(st.session_state.chat_history or [])
+    st.write(user_template.replace("{{MSG}}", user_question), unsafe_allow_html=True)
+
+    stream_handler = StreamHandler(st.empty())
+    answer = ask_question(user_question, [stream_handler], use_answer_cache)
+    add_chat_turn(user_question, answer)
+
+    # write the final answer once more in case the model did not stream it (or it came from the answer cache)
+    stream_handler.container.write(bot_template.replace("{{MSG}}", answer), unsafe_allow_html=True)
+
+
+def handle_user_question(user_question, use_answer_cache=True):   
+    # Get the answer of the conversational AI model (or a stored answer to the same question)
+    answer = ask_question(user_question, use_answer_cache=use_answer_cache)
     
     # Update the chat history in the session state with the new response
-    st.session_state.chat_history = response['chat_history']
+    add_chat_turn(user_question, answer)
 
     # Loop through the chat history to display each message
     for i, message in enumerate(st.session_state.chat_history):
@@ -153,6 +386,14 @@ def main():
     # check if conversation is in the session state
     if "conversation" not in st.session_state:
         st.session_state.conversation = None
+    if "chat_history" not in st.session_state:
+        st.session_state.chat_history = None
+
+    # vectorstore of this session and the text of every PDF indexed in it (keyed by file hash)
+    if "vectorstore" not in st.session_state:
+        st.session_state.vectorstore = None
+        st.session_state.file_texts = {}
+        st.session_state.index_key = None
 
      # Apply CSS
     st.markdown(custom_css, unsafe_allow_html=True)
@@ -191,32 +432,46 @@ def main():
     ''', unsafe_allow_html=True)
 
 
+    memory_mode = st.sidebar.selectbox("Conversation memory", ["Token budget", "Full history"])
+    retriever_mode = st.sidebar.selectbox("Retriever", ["Hybrid (BM25 + vector)", "Vector"])
+
     user_pdfs = st.file_uploader("Upload your PDFs here and click on 'Process'", accept_multiple_files=True)
     
     if st.button("Process", use_container_width=True):
+        if not user_pdfs:
+            st.warning("Please upload at least one PDF.")
+        else:
             with st.spinner("Process"):
-                # get the PDF text 
-                PDF_raw_text = get_pdf_text(user_pdfs)
+                embeddings = get_embeddings()
 
-                # get the text Chunks
-                text_chunks = get_text_chunks(PDF_raw_text)
+                # add the new PDFs to the session vectorstore and remove the deleted ones
+                vectorstore, file_texts, index_key, bm25 = sync_vectorstore(user_pdfs, embeddings)
 
-                # create vectore store
-                vectorstore = get_vectorstore(text_chunks)
-
-                # create conversation chain 
-                st.session_state.conversation = get_conversation_chain(vectorstore)
+                # create conversation chain, the retriever indexes are rebuilt and the chat history is kept
+                memory = st.session_state.conversation.memory if st.session_state.conversation else None
+                st.session_state.conversation = get_conversation_chain(vectorstore, memory, memory_mode, retriever_mode, bm25)
+                st.session_state.vectorstore = vectorstore
+                st.session_state.file_texts = file_texts
+                st.session_state.index_key = index_key # document set hash, used by the answer cache
                 
                 st.success("Done!")
 
                 # Allow the user to view the PDF text
                 with st.expander("Click to view the PDF text"):
-                    st.write(PDF_raw_text)
+                    st.write("\n".join(entry["text"] for entry in file_texts.values()))
 
     user_question = st.text_input("Ask a question about your documents:")
     
+    stream_answers = st.sidebar.checkbox("Stream answers", value=True)
+    use_answer_cache = st.sidebar.checkbox("Reuse answers to repeated questions", value=True)
+    answer_cache_stats = get_answer_cache().stats()
+    st.sidebar.caption(f"Answer cache: {answer_cache_stats['hits']} hits / {answer_cache_stats['misses']} misses")
+    
     if user_question:
-        handle_user_question(user_question)
+        if stream_answers:
+            handle_user_question_streaming(user_question, use_answer_cache)
+        else:
+            handle_user_question(user_question, use_answer_cache)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
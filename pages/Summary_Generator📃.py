@@ -2,121 +2,106 @@
 import openai
 import streamlit as st
 import os
+import hashlib
+import tempfile
+import uuid
 from dotenv import load_dotenv
-from langchain.document_loaders import PyPDFLoader
-from langchain import PromptTemplate
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains.summarize import load_summarize_chain
 from langchain.chat_models import ChatOpenAI
-import base64
-import requests
-from bs4 import BeautifulSoup
-from youtube_transcript_api import YouTubeTranscriptApi
-from youtube_transcript_api.formatters import TextFormatter
-import re
+from CacheUtils import cache_dir, evict_lru, remove_entry, touch
+from PdfPreview import page_count, render_pages
+from ExtractiveCompressor import ExtractiveCompressor
+from SummaryPipeline import setup_documents, split_text_documents, fetch_blog_content, fetch_youtube_transcript, custom_summary
 
 # Load environment variables from the .env file
 load_dotenv()
 openai.api_key = os.environ["OPENAI_API_KEY"]
 
-# Cache the function to avoid redundant processing of the same PDF file
-@st.cache_data
-def setup_documents(pdf_file_path, chunk_size, chunk_overlap):
-    """
-    Load and split a PDF file into smaller chunks for processing.
-    Args:
-        pdf_file_path (str): Path to the PDF file.
-        chunk_size (int): Size of each text chunk.
-        chunk_overlap (int): Overlap between chunks.
-    Returns:
-        List[Document]: List of text chunks as LangChain documents.
-    """
-    loader = PyPDFLoader(pdf_file_path)  # Load the PDF file
-    docs_raw = loader.load()  # Extract raw text from the PDF
-    docs_raw_text = [doc.page_content for doc in docs_raw]  # Extract text content from each page
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    docs = text_splitter.create_documents(docs_raw_text)  # Split text into chunks
-    return docs
-
-def show_pdf_with_expander(file_path):
-    """
-    Display a PDF file in an expandable section using base64 encoding.
-    Args:
-        file_path (str): Path to the PDF file.
-    """
-    with st.expander("Click to view the PDF"):
-        with open(file_path, "rb") as f:
-            base64_pdf = base64.b64encode(f.read()).decode("utf-8")  # Encode PDF to base64
-        pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="850" height="1000" type="application/pdf"></iframe>'
-        st.markdown(pdf_display, unsafe_allow_html=True)  # Display PDF in an iframe
+# Uploads are hashed while they are copied to disk in blocks of this size
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+# Seconds a fetched blog text is reused across reruns (each keystroke in the page reruns it)
+BLOG_CACHE_TTL = int(os.getenv("SUMMARY_BLOG_CACHE_TTL", "600"))
+# Pages shown at once in the PDF preview
+PREVIEW_PAGES = 3
+# Size budget of the session upload folders, the least recently used sessions are deleted first
+UPLOAD_CACHE_MAX_MB = int(os.getenv("SUMMARY_UPLOAD_CACHE_MAX_MB", "512"))
 
-def fetch_blog_content(url):
+def get_session_dir():
     """
-    Fetch and extract text content from a blog URL.
-    Args:
-        url (str): URL of the blog.
+    Temporary folder of the current session, so concurrent users never share an upload file.
+    The folders live in the "summary_uploads" cache, where the ones of old sessions are evicted.
     Returns:
-        str: Extracted text content.
+        str: Path to the folder.
     """
-    try:
-        response = requests.get(url)  # Send a GET request to the blog URL
-        soup = BeautifulSoup(response.content, "html.parser")  # Parse the HTML content
-        paragraphs = soup.find_all("p")  # Find all paragraph tags
-        content = "\n".join([p.get_text() for p in paragraphs if p.get_text()])  # Extract text from paragraphs
-        return content
-    except Exception as e:
-        st.error(f"Error fetching blog content: {e}")  # Display error message if fetching fails
-        return None
-
-def fetch_youtube_transcript(video_url):
+    if "upload_dir" not in st.session_state or not os.path.isdir(st.session_state.upload_dir):
+        st.session_state.upload_dir = tempfile.mkdtemp(prefix="session-", dir=cache_dir("summary_uploads"))
+    touch(st.session_state.upload_dir)  # the session is still in use
+    return st.session_state.upload_dir
+
+def spool_upload(uploaded_file):
     """
-    Fetch the transcript of a YouTube video using its URL.
+    Copy an upload into the session folder block by block, hashing it on the way.
+    The file is named after its hash, so reruns with the same upload do not write it again.
     Args:
-        video_url (str): URL of the YouTube video.
+        uploaded_file: Streamlit UploadedFile.
     Returns:
-        tuple: (formatted_transcript, video_id) or (None, None) if an error occurs.
+        tuple: (file_hash, file_path)
     """
-    # Extract video ID using regex
-    video_id_match = re.search(r"(?:youtube\.com\/(?:[^\/]+\/.+\/|\S*?[?&]v=)|youtu\.be\/)([a-zA-Z0-9_-]+)", video_url)
-    if not video_id_match:
-        st.error("Invalid YouTube URL.")  # Display error if the URL is invalid
-        return None, None
-
-    video_id = video_id_match.group(1)  # Extract the video ID
-    try:
-        transcript = YouTubeTranscriptApi.get_transcript(video_id)  # Fetch the transcript
-        formatter = TextFormatter()
-        formatted_transcript = formatter.format_transcript(transcript)  # Format the transcript as plain text
-        return formatted_transcript, video_id
-    except Exception as e:
-        st.error(f"Error fetching transcript: {e}")  # Display error if fetching fails
-        return None, None
-
-def custom_summary(docs, llm, custom_prompt, chain_type, num_summaries):
+    session_dir = get_session_dir()
+    upload_id = getattr(uploaded_file, "file_id", None)
+    spooled = st.session_state.get("spooled_upload")
+    if upload_id and spooled and spooled[0] == upload_id and os.path.exists(spooled[2]):
+        return spooled[1], spooled[2]  # same upload as the previous rerun
+    uploaded_file.seek(0)
+    hasher = hashlib.sha256()
+    tmp_path = os.path.join(session_dir, f".tmp-{uuid.uuid4().hex}")
+    with open(tmp_path, "wb") as f:
+        for block in iter(lambda: uploaded_file.read(UPLOAD_BLOCK_SIZE), b""):
+            hasher.update(block)
+            f.write(block)
+    file_hash = hasher.hexdigest()
+    file_path = os.path.join(session_dir, f"{file_hash}.pdf")
+    os.replace(tmp_path, file_path)
+    for name in os.listdir(session_dir):  # keep only the current upload of this session
+        if name != f"{file_hash}.pdf":
+            remove_entry(os.path.join(session_dir, name))
+    st.session_state.spooled_upload = (upload_id, file_hash, file_path)
+    evict_lru(os.path.dirname(session_dir), UPLOAD_CACHE_MAX_MB * 1024 * 1024, keep={os.path.basename(session_dir)})
+    return file_hash, file_path
+
+# Cache the split documents by file content (the path is per session and not part of the key)
+@st.cache_data(max_entries=32)
+def load_documents(file_hash, _pdf_file_path, chunk_size, chunk_overlap):
+    return setup_documents(file_hash, _pdf_file_path, chunk_size, chunk_overlap)
+
+# Cache the fetched blog text by URL string, returns (text, error messages)
+@st.cache_data(ttl=BLOG_CACHE_TTL, max_entries=64, show_spinner=False)
+def load_blog_content(blog_url):
+    errors = []
+    return fetch_blog_content(blog_url, on_error=errors.append), errors
+
+# Cache the page count by file content
+@st.cache_data(max_entries=64)
+def get_page_count(file_hash, _file_path):
+    return page_count(_file_path)
+
+def show_pdf_with_expander(file_hash, file_path):
     """
-    Generate summaries using a custom prompt and selected chain type.
+    Display a PDF file in an expandable section, a few pages at a time.
+    Only the pages in view are rendered (as cached, downscaled images), so the
+    size of the file does not matter and nothing is rendered until asked for.
     Args:
-        docs (List[Document]): List of text chunks to summarize.
-        llm: Language model to use for summarization.
-        custom_prompt (str): Custom prompt for summarization.
-        chain_type (str): Type of summarization chain (map_reduce, stuff, refine).
-        num_summaries (int): Number of summaries to generate.
-    Returns:
-        List[str]: List of generated summaries.
+        file_hash (str): sha256 of the PDF bytes.
+        file_path (str): Path to the PDF file.
     """
-    custom_prompt = custom_prompt + """:\n {text}"""  # Append the custom prompt
-    COMBINE_PROMPT = PromptTemplate(template=custom_prompt, input_variables=["text"])
-    MAP_PROMPT = PromptTemplate(template="Summarize:\n{text}", input_variables=["text"])
-    if chain_type == "map_reduce":
-        chain = load_summarize_chain(llm, chain_type=chain_type, map_prompt=MAP_PROMPT, combine_prompt=COMBINE_PROMPT)
-    else:
-        chain = load_summarize_chain(llm, chain_type=chain_type)
-
-    summaries = []
-    for i in range(num_summaries):
-        summary_output = chain({"input_documents": docs}, return_only_outputs=True)["output_text"]  # Generate summary
-        summaries.append(summary_output)
-    return summaries
+    with st.expander("Click to view the PDF"):
+        if not st.checkbox("Show the preview", key="show_pdf_preview"):
+            return
+        total_pages = get_page_count(file_hash, file_path)
+        first_page = st.number_input("First page", min_value=1, max_value=total_pages, value=1, step=PREVIEW_PAGES)
+        last_page = min(total_pages, first_page + PREVIEW_PAGES - 1)
+        st.caption(f"Pages {first_page} to {last_page} of {total_pages}")
+        for image_path in render_pages(file_hash, file_path, first_page, last_page):
+            st.image(image_path)  # Display each page as an image
 
 # Custom CSS for styling the Streamlit app
 custom_css = """
@@ -173,8 +158,9 @@ def main():
     # Sidebar options
     llm = st.sidebar.selectbox("LLM", ["ChatGPT", "GPT4", "Other (open source in the future)"])  # Select LLM
     chain_type = st.sidebar.selectbox("Chain Type", ["map_reduce", "stuff", "refine"])  # Select chain type
-    chunk_size = st.sidebar.slider("Chunk Size", min_value=20, max_value=10000, step=10, value=2000)  # Set chunk size
-    chunk_overlap = st.sidebar.slider("Chunk Overlap", min_value=5, max_value=5000, step=10, value=200)  # Set chunk overlap
+    chunk_size = st.sidebar.slider("Chunk Size (tokens)", min_value=50, max_value=4000, step=10, value=500)  # Set chunk size
+    chunk_overlap = st.sidebar.slider("Chunk Overlap (tokens)", min_value=0, max_value=1000, step=10, value=50)  # Set chunk overlap
+    chunk_overlap = min(chunk_overlap, chunk_size - 10)  # The overlap must stay smaller than the chunk
 
     # Select summarization type
     summarization_type = st.radio("What would you like to summarize?", ["PDF Document", "Blog", "YouTube Video"])
@@ -183,27 +169,27 @@ def main():
     if summarization_type == "PDF Document":
         pdf_file = st.file_uploader("Upload a PDF file", type=["pdf"])  # Upload PDF file
         if pdf_file:
-            temp_file_path = "temp_uploaded_file.pdf"
-            with open(temp_file_path, "wb") as f:
-                f.write(pdf_file.read())  # Save the uploaded file temporarily
+            file_hash, temp_file_path = spool_upload(pdf_file)  # Save the upload in the session folder
             user_prompt = st.text_input("Enter the custom summary prompt")  # Input custom prompt
-            show_pdf_with_expander(temp_file_path)  # Display the PDF
-            docs = setup_documents(temp_file_path, chunk_size, chunk_overlap)  # Process the PDF
+            show_pdf_with_expander(file_hash, temp_file_path)  # Display the PDF
+            docs = load_documents(file_hash, temp_file_path, chunk_size, chunk_overlap)  # Process the PDF
             st.write("PDF loaded successfully")
 
     # Handle Blog summarization
     elif summarization_type == "Blog":
-        blog_url = st.text_input("Enter a blog URL")  # Input blog URL
+        blog_url = st.text_input("Enter a blog URL (separate several URLs with spaces)")  # Input blog URL
         blog_content = st.text_area("Or paste blog content manually")  # Input manual blog content
         if blog_url:
             st.write("Fetching blog content...")
-            content = fetch_blog_content(blog_url)  # Fetch blog content
+            content, errors = load_blog_content(blog_url)  # Fetch blog content
+            for error in errors:
+                st.error(error)
             if content:
-                docs = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).create_documents([content])  # Process blog content
+                docs = split_text_documents(content, chunk_size, chunk_overlap)  # Process blog content
                 user_prompt = st.text_input("Enter the custom summary prompt")
                 st.write("Blog content loaded successfully")
         elif blog_content:
-            docs = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).create_documents([blog_content])  # Process manual content
+            docs = split_text_documents(blog_content, chunk_size, chunk_overlap)  # Process manual content
             user_prompt = st.text_input("Enter the custom summary prompt")
             st.write("Manual blog content loaded successfully")
 
@@ -212,18 +198,20 @@ def main():
         video_url = st.text_input("Enter YouTube video URL")  # Input YouTube URL
         if video_url:
             st.write("Fetching YouTube transcript...")
-            transcript, video_id = fetch_youtube_transcript(video_url)  # Fetch transcript
+            transcript, video_id = fetch_youtube_transcript(video_url, on_error=st.error)  # Fetch transcript
             if transcript:
                 # Display the embedded YouTube video
                 video_embed_code = f'<iframe width="1000" height="450" src="https://www.youtube.com/embed/{video_id}" frameborder="0" allow="accelerometer; autoplay; encrypted-media; gyroscope; picture-in-picture" allowfullscreen></iframe>'
                 st.markdown(video_embed_code, unsafe_allow_html=True)
-                docs = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).create_documents([transcript])  # Process transcript
+                docs = split_text_documents(transcript, chunk_size, chunk_overlap)  # Process transcript
                 user_prompt = st.text_input("Enter the custom summary prompt")
                 st.write("YouTube transcript loaded successfully")
 
     # Additional settings
     temperature = st.sidebar.number_input("Set the ChatGPT Temperature", min_value=0.0, max_value=1.0, step=0.1, value=0.5)  # Set temperature
     num_summaries = st.sidebar.number_input("Number of summaries", min_value=1, max_value=10, step=1, value=1)  # Set number of summaries
+    compress = st.sidebar.checkbox("Pre-compress the text", value=False, help="Drop references, headers and footers, then keep only the most central sentences")
+    keep_percent = st.sidebar.slider("Keep (% of tokens)", min_value=10, max_value=100, step=5, value=50, disabled=not compress)
 
     # Summarize button
     if summarization_type and st.button("Summarize", use_container_width=True):
@@ -236,8 +224,22 @@ def main():
                 st.write("Using ChatGPT while open source models are not implemented!")
                 llm = ChatOpenAI(temperature=temperature)
 
-            # Generate summaries
-            result = custom_summary(docs, llm, user_prompt, chain_type, num_summaries)
+            if compress:
+                compressor = ExtractiveCompressor(ratio=keep_percent / 100, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+                docs, stats = compressor.compress_documents(docs)  # Keep the top sentences, repacked into full chunks
+                st.caption(f"Pre-compression kept {stats['tokens_after']} of {stats['tokens_before']} tokens "
+                           f"in {stats['chunks_after']} of {stats['chunks_before']} chunks")
+            if not docs:
+                st.error("No text left to summarize. Try a higher keep percentage or turn pre-compression off.")
+                return
+
+            # Generate summaries, showing the progress of the map phase
+            progress_bar = st.progress(0.0, text="Summarizing the chunks...")
+            def show_progress(done, total, level=None):
+                stage = f"summaries (reduce level {level})" if level else "chunks"
+                progress_bar.progress(done / total, text=f"Summarized {done} of {total} {stage}")
+            result = custom_summary(docs, llm, user_prompt, chain_type, num_summaries, show_progress)
+            progress_bar.empty()
             st.write("Summary:")
             for summary in result:
                 st.write(summary)  # Display summaries
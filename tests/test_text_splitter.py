@@ -0,0 +1,46 @@
+"""
+Chunk boundaries of SentenceTokenSplitter.split_offsets, counted in whitespace separated words
+so the tests run without downloading a tiktoken encoding.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from TextSplitter import SentenceTokenSplitter  # noqa: E402
+
+
+class WordEncoding:
+    @staticmethod
+    def encode_ordinary(text):
+        return text.split()
+
+
+def make_splitter(chunk_size, chunk_overlap=0):
+    splitter = SentenceTokenSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    splitter._encoding = WordEncoding()
+    return splitter
+
+
+def test_fitting_chunk_that_ends_on_a_paragraph_is_kept_whole():
+    text = "a b c. d e f.\n\ng h i j.\n\nk l m. n o p."
+    assert make_splitter(10).split_text(text)[0] == "a b c. d e f.\n\ng h i j."
+
+
+def test_chunk_is_cut_back_to_the_last_paragraph_end():
+    text = "a b c. d e f.\n\ng h i. j k l. m n o."
+    assert make_splitter(10).split_text(text) == ["a b c. d e f.", "g h i. j k l. m n o."]
+
+
+def test_hard_wrapped_lines_stay_in_one_sentence():
+    text = "a b c\nd e.\nf g h\ni j."
+    assert make_splitter(6).split_text(text) == ["a b c\nd e.", "f g h\ni j."]
+
+
+def test_unit_longer_than_a_chunk_is_cut_at_line_breaks():
+    text = "a b c d\ne f g h\ni j"
+    assert make_splitter(5).split_text(text) == ["a b c d", "e f g h", "i j"]
+
+
+def test_overlap_repeats_whole_sentences():
+    text = "a b. c d. e f. g h."
+    assert make_splitter(6, chunk_overlap=2).split_offsets(text).tolist() == [[0, 14], [10, 19]]